@@ -0,0 +1,83 @@
+"""Fleet-wide consumption questions, answered from monthly_rollups.
+
+Each rollup already carries a customer-month's extra/less/skip figures (see
+rollups.py; older rollups get them from `python rollups.py backfill`, and
+count as zero until then), so "top N by extra liters" and "who skipped more
+than K days" are a single indexed find over one month's rollups. The month-over-month trend is
+one aggregate command: the fleet's daily defaults from customers, plus a
+$unionWith branch that sums each month's rollups minus the defaults they replace.
+
+Customers with no variations in a month have no rollup there; they count as
+zero extra, less and skipped days.
+"""
+import calendar
+from rollups import ROLLUPS_COLLECTION
+
+RANKING_METRICS = {"extra_liters", "extra_count", "less_liters", "less_count", "skip_count", "variation_count"}
+MAX_TREND_MONTHS = 36
+
+def month_range(month: int, year: int, months: int):
+    """The `months` (year, month) pairs ending at month/year, oldest first."""
+    index = year * 12 + month - 1
+    return [(i // 12, i % 12 + 1) for i in range(index - months + 1, index + 1)]
+
+def stat_row(rollup):
+    return {"customer_id": rollup["customer_id"], "customer_name": rollup["customer_name"],
+            "total_liters": round(rollup["total_morning"] + rollup["total_evening"], 2),
+            # Missing on rollups older than these fields, and null on those written to since, until the backfill runs
+            "extra_days": rollup.get("extra_count") or 0, "extra_liters": round(rollup.get("extra_liters") or 0, 2),
+            "less_days": rollup.get("less_count") or 0, "less_liters": round(rollup.get("less_liters") or 0, 2),
+            "skipped_days": rollup["skip_count"]}
+
+async def top_customers(db, month: int, year: int, metric: str = "extra_liters", limit: int = 10):
+    """The `limit` customers with the highest `metric` in the month; customers at zero are left out."""
+    cursor = db[ROLLUPS_COLLECTION].find({"year": year, "month": month, metric: {"$gt": 0}}).sort([(metric, -1), ("customer_id", 1)]).limit(limit)
+    return [stat_row(r) async for r in cursor]
+
+async def frequent_skippers(db, month: int, year: int, min_skips: int, limit: int = 100):
+    """Customers who skipped more than `min_skips` days in the month, most skips first."""
+    cursor = db[ROLLUPS_COLLECTION].find({"year": year, "month": month, "skip_count": {"$gt": min_skips}}).sort([("skip_count", -1), ("customer_id", 1)]).limit(limit)
+    return [stat_row(r) async for r in cursor]
+
+def trend_pipeline(months):
+    default_liters = {"$multiply": [{"$add": ["$customer.default_milk_morning", "$customer.default_milk_evening"]}, "$num_days"]}
+    return [
+        {"$group": {"_id": "defaults", "liters": {"$sum": {"$add": ["$default_milk_morning", "$default_milk_evening"]}},
+                    "amount": {"$sum": {"$multiply": [{"$add": ["$default_milk_morning", "$default_milk_evening"]}, "$price_per_liter"]}},
+                    "customers": {"$sum": 1}}},
+        {"$unionWith": {"coll": ROLLUPS_COLLECTION, "pipeline": [
+            {"$match": {"$or": [{"year": y, "month": m} for y, m in months]}},
+            {"$lookup": {"from": "customers", "let": {"oid": {"$convert": {"input": "$customer_id", "to": "objectId", "onError": None, "onNull": None}}},
+                         "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", "$$oid"]}}}, {"$project": {"default_milk_morning": 1, "default_milk_evening": 1}}],
+                         "as": "customer"}},
+            {"$unwind": "$customer"},
+            {"$set": {"delta": {"$subtract": [{"$add": ["$total_morning", "$total_evening"]}, default_liters]}}},
+            {"$group": {"_id": {"year": "$year", "month": "$month"},
+                        "delta_liters": {"$sum": "$delta"}, "delta_amount": {"$sum": {"$multiply": ["$delta", "$price_per_liter"]}},
+                        "extra_liters": {"$sum": "$extra_liters"}, "less_liters": {"$sum": "$less_liters"}, "skipped_days": {"$sum": "$skip_count"},
+                        "customers_with_variations": {"$sum": 1}}},
+        ]}},
+    ]
+
+async def consumption_trend(db, month: int, year: int, months: int = 6):
+    """Fleet totals for the `months` months ending at month/year, each with its change from the month before."""
+    keys = month_range(month, year, months)
+    defaults, by_month = {"liters": 0.0, "amount": 0.0, "customers": 0}, {}
+    async for row in await db.customers.aggregate(trend_pipeline(keys)):
+        if row["_id"] == "defaults":
+            defaults = row
+        else:
+            by_month[(row["_id"]["year"], row["_id"]["month"])] = row
+    trend, previous = [], None
+    for y, m in keys:
+        num_days = calendar.monthrange(y, m)[1]
+        row = by_month.get((y, m), {})
+        liters = defaults["liters"] * num_days + row.get("delta_liters", 0.0)
+        trend.append({
+            "year": y, "month": m, "customers": defaults["customers"], "customers_with_variations": row.get("customers_with_variations", 0),
+            "total_liters": round(liters, 2), "amount_due": round(defaults["amount"] * num_days + row.get("delta_amount", 0.0), 2),
+            "extra_liters": round(row.get("extra_liters", 0.0), 2), "less_liters": round(row.get("less_liters", 0.0), 2), "skipped_days": row.get("skipped_days", 0),
+            "change_pct": round((liters - previous) / previous * 100, 1) if previous else None,
+        })
+        previous = liters
+    return trend
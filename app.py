@@ -1,15 +1,26 @@
 
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import datetime
-import pandas as pd
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import re
-from streamlit_chat import message
+from urllib.parse import urlencode
+from name_index import NameIndex
+from write_queue import WriteQueue
 
 # --- Page and API Configuration ---
 st.set_page_config(layout="wide", page_title="Dairy Manager")
 
 API_URL = "https://dairy-management-system-w9pd.onrender.com"
+CACHE_TTL_SECONDS = 60
+# (connect, read) seconds; reads are long enough to ride out a Render cold start
+REQUEST_TIMEOUT = (10, 60)
+CUSTOMERS_PAGE_SIZE = 100
+QUEUE_PATH = os.getenv("DAIRY_QUEUE_PATH", "pending_writes.sqlite3")
 
 st.title("Dairy Management System")
  
@@ -22,6 +33,113 @@ if 'show_log' not in st.session_state:
     st.session_state.show_log = False
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
+if 'customer_page_cursors' not in st.session_state:
+    # The 'after' cursor of each page visited in the customer grid, for the Previous button
+    st.session_state.customer_page_cursors = [None]
+if 'api_cache' not in st.session_state:
+    st.session_state.api_cache = {}
+# Timing stats are per rerun, i.e. per rendered page
+st.session_state.api_stats = {"hits": 0, "misses": 0, "calls": []}
+
+# --- HTTP Session and Cache ---
+@st.cache_resource
+def get_http_session():
+    """One pooled keep-alive session for the whole server process, so reruns skip the TLS handshake."""
+    session = requests.Session()
+    # Only idempotent GETs are retried on bad statuses; a POST is never sent twice
+    # raise_on_status=False hands back the last 5xx response instead of raising RetryError
+    # read=0: a read timeout already waited REQUEST_TIMEOUT[1], so retrying it could block a rerun for minutes
+    retry = Retry(total=3, read=0, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=["GET"], raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+@st.cache_resource
+def get_write_queue():
+    """The process-wide write-behind queue; its flusher thread starts with it."""
+    return WriteQueue(QUEUE_PATH, get_http_session(), API_URL)
+
+def queue_variations(customer_ids, dates, morn_qty, eve_qty):
+    """Queues one variation per customer and date; returns how many were queued."""
+    queue = get_write_queue()
+    for customer_id in customer_ids:
+        for log_date in dates:
+            queue.enqueue_variation({"customer_id": customer_id, "date": log_date.isoformat(), "morning_quantity": morn_qty, "evening_quantity": eve_qty})
+    return len(customer_ids) * len(dates)
+
+def variation_form(customer_id):
+    """The Log Variation form; it only queues, so it works while the API is down."""
+    with st.form("variation_form"):
+        var_dates = st.date_input("Date or Date Range", (datetime.date.today(), datetime.date.today()), max_value=datetime.date.today())
+        morn_qty = st.number_input("Morning Quantity (Liters)", min_value=0.0, step=0.25, format="%.2f")
+        eve_qty = st.number_input("Evening Quantity (Liters)", min_value=0.0, step=0.25, format="%.2f")
+        if st.form_submit_button("Log Variation"):
+            # A range picker returns a 1-tuple until the end date is chosen
+            start_date, end_date = (var_dates[0], var_dates[-1]) if isinstance(var_dates, (tuple, list)) else (var_dates, var_dates)
+            dates = [start_date + datetime.timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+            queue_variations([customer_id], dates, morn_qty, eve_qty)
+            label = start_date if start_date == end_date else f"{start_date} to {end_date}"
+            st.success(f"Variation on {label} queued!")
+
+def record_call(method, path, elapsed, status):
+    st.session_state.api_stats["calls"].append({"Request": f"{method} {path}", "Status": status, "Latency (ms)": round(elapsed * 1000, 1)})
+
+def timed_get(session, path, params):
+    """Runs on worker threads, so it must not touch st.session_state. Returns (response or None, elapsed, error)."""
+    started = time.perf_counter()
+    try:
+        response = session.get(f"{API_URL}{path}", params=params, timeout=REQUEST_TIMEOUT)
+    except requests.exceptions.RequestException as e:
+        return None, time.perf_counter() - started, e
+    return response, time.perf_counter() - started, None
+
+def api_get_many(calls):
+    """GETs several (path, params) pairs through the session cache, fetching the misses concurrently.
+
+    Returns the JSON bodies in order, with None for any non-200 response or failed request.
+    """
+    # Anything cached before the queue last flushed may be missing those writes
+    generation = get_write_queue().generation
+    if st.session_state.get('queue_generation') != generation:
+        st.session_state.api_cache.clear()
+        st.session_state.queue_generation = generation
+    results, pending = [None] * len(calls), []
+    for i, (path, params) in enumerate(calls):
+        cached = st.session_state.api_cache.get((path, tuple(sorted((params or {}).items()))))
+        if cached and cached[0] > time.monotonic():
+            st.session_state.api_stats["hits"] += 1
+            results[i] = cached[1]
+        else:
+            st.session_state.api_stats["misses"] += 1
+            pending.append(i)
+    session = get_http_session()
+    if len(pending) == 1:
+        responses = [timed_get(session, *calls[pending[0]])]
+    elif pending:
+        with ThreadPoolExecutor(max_workers=min(8, len(pending))) as pool:
+            responses = list(pool.map(lambda i: timed_get(session, *calls[i]), pending))
+    else:
+        responses = []
+    unreachable = False
+    for i, (response, elapsed, error) in zip(pending, responses):
+        path, params = calls[i]
+        if response is None:
+            record_call("GET", path, elapsed, type(error).__name__)
+            unreachable = True
+            continue
+        record_call("GET", path, elapsed, response.status_code)
+        if response.status_code == 200:
+            results[i] = response.json()
+            st.session_state.api_cache[(path, tuple(sorted((params or {}).items())))] = (time.monotonic() + CACHE_TTL_SECONDS, results[i])
+    if unreachable:
+        st.sidebar.error("Connection Error! Could not reach the API.")
+    return results
+
+def api_get(path, params=None):
+    """GETs a JSON endpoint through the session cache. Returns None on any non-200 response."""
+    return api_get_many([(path, params)])[0]
+
 
 # --- Helper Functions ---
 def parse_dates_from_command(command):
@@ -47,22 +165,89 @@ def parse_dates_from_command(command):
     if not dates: dates.append(datetime.date.today())
     return dates
 
-def get_customers():
+def get_customers(fields=None, after=None, limit=None):
+    params = {k: v for k, v in {"fields": fields, "after": after, "limit": limit}.items() if v is not None}
     try:
-        response = requests.get(f"{API_URL}/customers")
-        if response.status_code == 200:
-            return response.json()
-    except requests.exceptions.ConnectionError:
+        customers = api_get("/customers", params=params)
+        if customers is not None:
+            return customers
+    except requests.exceptions.RequestException:
         st.sidebar.error("Connection Error!")
         return []
     return []
 
+def get_known_customers():
+    """Every customer for name matching; while the API is unreachable, the last list saved in the queue file."""
+    customers = api_get("/customers", params={"fields": "_id,name,default_milk_morning,default_milk_evening"})
+    queue = get_write_queue()
+    if customers is None:
+        customers = queue.known_customers()
+        if customers: st.sidebar.warning("Working offline: customer names come from the last list this app loaded.")
+        return customers
+    # api_get hands back the same list object while it is cached, so this only writes after a refetch
+    if st.session_state.get('saved_customers') is not customers:
+        queue.save_customers(customers)
+        st.session_state.saved_customers = customers
+    return customers
+
+def get_name_index(customers):
+    """The NameIndex for this customer list, rebuilt only when the list itself is refetched."""
+    cached = st.session_state.get('name_index')
+    if cached is None or cached[0] is not customers:
+        cached = (customers, NameIndex(customers))
+        st.session_state.name_index = cached
+    return cached[1]
+
+# Phrases that make a command fleet-wide even if it also contains a customer's name
+FLEET_KEYWORDS = ["fleet", "all customers", "every customer", "which customers", "who skipped", "trend", "month over month", "month-over-month"]
+
+def is_fleet_command(command):
+    return any(k in command for k in FLEET_KEYWORDS) or re.search(r'top\s+\d+', command) is not None
+
+def process_fleet_command(command):
+    """Answers fleet-wide questions; returns None if the command is not one."""
+    today = datetime.date.today()
+    month, year = today.month, today.year
+    if "last month" in command:
+        month, year = (12, year - 1) if month == 1 else (month - 1, year)
+
+    # Fleet Intent: Month-over-month consumption trend
+    if any(w in command for w in ["trend", "month over month", "month-over-month"]):
+        months_match = re.search(r'last\s+(\d+)\s+months', command)
+        trend = api_get("/analytics/trend", params={"month": month, "year": year, "months": int(months_match.group(1)) if months_match else 6})
+        if trend is None: return "❌ Could not retrieve the consumption trend."
+        lines = []
+        for row in trend:
+            change = f" ({row['change_pct']:+.1f}%)" if row['change_pct'] is not None else ""
+            lines.append(f"**{row['month']}/{row['year']}:** {row['total_liters']:.2f}L{change}, {row['skipped_days']} skipped day(s)")
+        return "📈 Fleet consumption by month:\n- " + "\n- ".join(lines)
+
+    # Fleet Intent: Customers who skipped more than K days
+    skip_match = re.search(r'skip\w*\s+(more than|over|at least)\s+(\d+)', command)
+    if skip_match or (("who" in command or "which" in command) and "skip" in command):
+        min_skips = 0
+        if skip_match:
+            min_skips = int(skip_match.group(2)) - (1 if skip_match.group(1) == "at least" else 0)
+        skippers = api_get("/analytics/skippers", params={"month": month, "year": year, "min_skips": min_skips})
+        if skippers is None: return "❌ Could not retrieve skipped deliveries."
+        if not skippers: return f"No customer skipped more than {min_skips} day(s) in {month}/{year}."
+        return f"🚫 Customers who skipped more than {min_skips} day(s) in {month}/{year}:\n- " + "\n- ".join(f"**{c['customer_name']}**: {c['skipped_days']} day(s)" for c in skippers)
+
+    # Fleet Intent: Top N customers by extra (or less) milk
+    top_match = re.search(r'top\s+(\d+)', command)
+    if top_match or "most" in command:
+        metric, label = ("less_liters", "less") if "less" in command else ("extra_liters", "extra")
+        top = api_get("/analytics/top_customers", params={"month": month, "year": year, "metric": metric, "limit": int(top_match.group(1)) if top_match else 5})
+        if top is None: return "❌ Could not retrieve the customer ranking."
+        if not top: return f"No customer took {label} milk in {month}/{year}."
+        return f"🏆 Top customers by {label} milk in {month}/{year}:\n- " + "\n- ".join(f"**{c['customer_name']}**: {c[metric]:.2f}L over {c[label + '_days']} day(s)" for c in top)
+    return None
+
 # --- MODIFIED: Rewritten Global Assistant Logic ---
 def process_global_chat_command(command):
     """Parses commands that can target any customer by name."""
     command = command.lower()
-    customers = get_customers()
-    customer_map = {c['name'].lower(): c for c in customers}
+    customers = get_known_customers()
 
     # Intent 0: Add New Customer
     if "add new customer" in command:
@@ -92,19 +277,21 @@ def process_global_chat_command(command):
             customer_data = {"name": name, "address": "", "phone_number": "", 
                              "default_milk_morning": morn_qty, "default_milk_evening": eve_qty}
             
-            response = requests.post(f"{API_URL}/customers", json=customer_data)
-            return f"✅ Success! Customer '{name}' added with {morn_qty}L morning and {eve_qty}L evening default milk." if response.status_code == 201 else f"❌ Error: {response.text}"
+            get_write_queue().enqueue_customer(customer_data)
+            return f"✅ Success! Customer '{name}' queued with {morn_qty}L morning and {eve_qty}L evening default milk."
         except Exception as e: return f"An error occurred: {e}"
 
-    # Find which customer is being talked about for all other intents
-    target_customer = None
-    for name, customer_data in customer_map.items():
-        if name in command:
-            target_customer = customer_data
-            break
+    # Fleet questions first, so a customer name that happens to appear ("top 5 like ram") does not capture them
+    if is_fleet_command(command):
+        answer = process_fleet_command(command)
+        if answer: return answer
+
+    # Find which customers are being talked about for all other intents
+    target_customers = get_name_index(customers).find_all(command)
     
-    if not target_customer:
-        return "Please mention a valid customer's name in your request."
+    if not target_customers:
+        return process_fleet_command(command) or "Please mention a valid customer's name in your request."
+    target_customer = target_customers[0]
 
     customer_id = target_customer['_id']
     customer_name = target_customer['name']
@@ -124,29 +311,30 @@ def process_global_chat_command(command):
             else: return "Please specify morning or evening."
             
             dates_to_log = parse_dates_from_command(command)
-            success_count = 0
-            for log_date in dates_to_log:
-                variation_data = {"customer_id": customer_id, "date": log_date.isoformat(), "morning_quantity": morn_qty, "evening_quantity": eve_qty}
-                response = requests.post(f"{API_URL}/variations", json=variation_data)
-                if response.status_code == 201: success_count += 1
+            success_count = queue_variations([c['_id'] for c in target_customers], dates_to_log, morn_qty, eve_qty)
             
-            return f"✅ Success! Logged variation for '{customer_name}' for {success_count} day(s)."
+            if len(target_customers) > 1:
+                names = ", ".join(f"'{c['name']}'" for c in target_customers)
+                return f"✅ Success! Queued {success_count} day(s) of variations for {names}."
+            return f"✅ Success! Queued variation for '{customer_name}' for {success_count} day(s)."
         except Exception as e: return f"An error occurred: {e}"
 
     # Intent 2: Get Bill
     elif any(word in command for word in ["bill", "total", "summary", "due"]):
-        sheet_response = requests.get(f"{API_URL}/customers/{customer_id}/monthly_sheet", params={"month": month, "year": year})
-        if sheet_response.status_code == 200:
-            totals = sheet_response.json().get("totals", {})
-            amount_due = totals.get("amount_due", 0)
-            return f"💰 The total bill for {customer_name} for {month}/{year} is ₹ {amount_due:.2f}."
-        else: return "❌ Error fetching the bill."
+        replies = []
+        sheets = api_get_many([(f"/customers/{customer['_id']}/monthly_sheet", {"month": month, "year": year}) for customer in target_customers])
+        for customer, sheet in zip(target_customers, sheets):
+            if sheet is not None:
+                totals = sheet.get("totals", {})
+                amount_due = totals.get("amount_due", 0)
+                replies.append(f"💰 The total bill for {customer['name']} for {month}/{year} is ₹ {amount_due:.2f}.")
+            else: replies.append(f"❌ Error fetching the bill for {customer['name']}.")
+        return "\n\n".join(replies)
     
     # Intent 3: Analyze Consumption Patterns
     elif any(word in command for word in ["extra", "more", "less", "skip", "didn't take", "not take"]):
-        summary_response = requests.get(f"{API_URL}/customers/{customer_id}/variations_summary", params={"month": month, "year": year})
-        if summary_response.status_code != 200: return "❌ Could not retrieve variation data."
-        summary_data = summary_response.json()
+        summary_data = api_get(f"/customers/{customer_id}/variations_summary", params={"month": month, "year": year})
+        if summary_data is None: return "❌ Could not retrieve variation data."
         if not summary_data: return f"No variations were logged for {customer_name} this month."
         
         more_days, less_days, skipped_days = [], [], []
@@ -198,6 +386,19 @@ if st.sidebar.button("➕ Add New Customer"):
     st.session_state.show_log = False 
     st.session_state.chat_history = []
 
+pending_writes, failed_writes = get_write_queue().counts()
+if pending_writes: st.sidebar.info(f"📤 {pending_writes} write(s) waiting to sync")
+if failed_writes:
+    st.sidebar.error(f"⚠️ {failed_writes} write(s) rejected by the server")
+    with st.sidebar.expander("Rejected Writes"):
+        for failure in get_write_queue().failures():
+            st.write(f"**{failure['kind']}** {failure['payload']}: {failure['error']}")
+        if st.button("Discard Rejected Writes"):
+            get_write_queue().discard_failed()
+            st.rerun()
+if pending_writes and st.sidebar.button("🔄 Sync Now"):
+    get_write_queue().flush_now()
+
 st.sidebar.markdown("---")
 st.sidebar.title("Navigation")
 if st.sidebar.button("🤖 Assistant"):
@@ -208,6 +409,14 @@ if st.sidebar.button("👥 All Customers"):
     st.session_state.page = 'all_customers_list'
     st.session_state.selected_customer_id = None
 
+if st.sidebar.button("🥛 Production Plan"):
+    st.session_state.page = 'production'
+    st.session_state.selected_customer_id = None
+
+if st.sidebar.button("📥 Export Sheets"):
+    st.session_state.page = 'export'
+    st.session_state.selected_customer_id = None
+
 # --- Main Page Content ---
 
 if st.session_state.page == 'home':
@@ -215,6 +424,7 @@ if st.session_state.page == 'home':
 
 elif st.session_state.page == 'assistant':
     st.subheader("🤖 Assistant")
+    from streamlit_chat import message
     for i, (query, response) in enumerate(st.session_state.chat_history):
         message(query, is_user=True, key=f"global_user_{i}")
         message(response, key=f"global_bot_{i}")
@@ -228,6 +438,36 @@ elif st.session_state.page == 'assistant':
                 st.session_state.chat_history = st.session_state.chat_history[-10:]
             st.rerun()
 
+elif st.session_state.page == 'production':
+    st.header("Production Plan")
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    plan_dates = st.date_input("Date or Date Range", (tomorrow, tomorrow))
+    # A range picker returns a 1-tuple until the end date is chosen
+    start_date, end_date = (plan_dates[0], plan_dates[-1]) if isinstance(plan_dates, (tuple, list)) else (plan_dates, plan_dates)
+    plan = api_get("/production", params={"start": start_date.isoformat(), "end": end_date.isoformat()})
+    if plan is not None:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Morning Run", f"{plan['total_morning']:.2f} L")
+        col2.metric("Evening Run", f"{plan['total_evening']:.2f} L")
+        col3.metric("Total", f"{plan['total_liters']:.2f} L")
+        if len(plan["days"]) > 1:
+            import pandas as pd
+            df = pd.DataFrame(plan["days"]).rename(columns={"date": "Date", "morning_liters": "Morning (L)", "evening_liters": "Evening (L)", "total_liters": "Total (L)", "variations": "Variations"})
+            st.bar_chart(df.set_index("Date")[["Morning (L)", "Evening (L)"]])
+            st.dataframe(df, use_container_width=True, hide_index=True)
+    else: st.error("Could not load the production plan.")
+
+elif st.session_state.page == 'export':
+    st.header("Export Daily Sheets")
+    st.write("Every customer's daily sheet for the range, one row per customer per day.")
+    today = datetime.date.today()
+    export_dates = st.date_input("Date Range", (today.replace(day=1), today))
+    start_date, end_date = (export_dates[0], export_dates[-1]) if isinstance(export_dates, (tuple, list)) else (export_dates, export_dates)
+    export_format = st.radio("Format", ["csv", "parquet"], horizontal=True, format_func=str.upper)
+    # The browser downloads straight from the API's stream, so the file never passes through this server's memory
+    export_url = f"{API_URL}/export/sheets?" + urlencode({"start": start_date.isoformat(), "end": end_date.isoformat(), "format": export_format})
+    st.link_button("⬇️ Download", export_url)
+
 elif st.session_state.page == 'add_customer':
     st.header("Add a New Customer")
     with st.form("new_customer_form"):
@@ -238,16 +478,15 @@ elif st.session_state.page == 'add_customer':
         default_eve = st.number_input("Default Evening Milk (Liters)", min_value=0.0, step=0.25, format="%.2f")
         if st.form_submit_button("Add Customer"):
             customer_data = {"name": name, "address": address, "phone_number": phone, "default_milk_morning": default_morn, "default_milk_evening": default_eve}
-            response = requests.post(f"{API_URL}/customers", json=customer_data)
-            if response.status_code == 201:
-                st.success(f"Customer '{name}' added!")
-                st.session_state.page = 'all_customers_list'
-                st.rerun()
-            else: st.error("Failed to add customer.")
+            get_write_queue().enqueue_customer(customer_data)
+            st.success(f"Customer '{name}' queued!")
+            st.session_state.page = 'all_customers_list'
+            st.rerun()
 
 elif st.session_state.page == 'all_customers_list':
     st.header("All Customers")
-    customers = get_customers()
+    cursors = st.session_state.customer_page_cursors
+    customers = get_customers(fields="_id,name", after=cursors[-1], limit=CUSTOMERS_PAGE_SIZE)
     if customers:
         cols = st.columns(4) 
         for i, cust in enumerate(customers):
@@ -257,12 +496,34 @@ elif st.session_state.page == 'all_customers_list':
                     st.session_state.selected_customer_id = cust['_id']
                     st.session_state.show_log = False
                     st.rerun()
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        if len(cursors) > 1 and col_prev.button("◀ Previous"):
+            cursors.pop()
+            st.rerun()
+        col_page.caption(f"Page {len(cursors)}")
+        if len(customers) == CUSTOMERS_PAGE_SIZE and col_next.button("Next ▶"):
+            cursors.append(customers[-1]['_id'])
+            st.rerun()
+    elif len(cursors) > 1:
+        cursors.pop()
+        st.rerun()
     else: st.info("No customers found. Click 'Add New Customer' to get started.")
 
 elif st.session_state.page == 'view_customer' and st.session_state.selected_customer_id:
-    customers = get_customers() 
-    selected_customer_details = next((cust for cust in customers if cust['_id'] == st.session_state.selected_customer_id), None)
-    if selected_customer_details:
+    # The month pickers render further down, so read their state first and fetch the whole page in one request
+    today = datetime.date.today()
+    sheet_month = st.session_state.get("sheet_month", today.month)
+    sheet_year = st.session_state.get("sheet_year", today.year)
+    dashboard = api_get(f"/customers/{st.session_state.selected_customer_id}/dashboard", params={"month": sheet_month, "year": sheet_year})
+    selected_customer_details = dashboard["customer"] if dashboard else None
+    if not selected_customer_details:
+        # Variations can still be queued for the customer; the queue sends them once the API is back
+        known = get_write_queue().known_customer(st.session_state.selected_customer_id)
+        st.header(f"Details for: {known['name']}" if known else "Customer Details")
+        st.warning("Could not load this customer from the API. Variations logged here are queued and sent when it is reachable.")
+        st.subheader("Log a Daily Variation")
+        variation_form(st.session_state.selected_customer_id)
+    else:
         st.header(f"Details for: {selected_customer_details['name']}")
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -275,26 +536,16 @@ elif st.session_state.page == 'view_customer' and st.session_state.selected_cust
         col_log, col_summary = st.columns(2)
         with col_log:
             st.subheader("Log a Daily Variation")
-            with st.form("variation_form"):
-                var_date = st.date_input("Date", datetime.date.today(), max_value=datetime.date.today())
-                morn_qty = st.number_input("Morning Quantity (Liters)", min_value=0.0, step=0.25, format="%.2f")
-                eve_qty = st.number_input("Evening Quantity (Liters)", min_value=0.0, step=0.25, format="%.2f")
-                if st.form_submit_button("Log Variation"):
-                    variation_data = {"customer_id": selected_customer_details['_id'], "date": var_date.isoformat(), "morning_quantity": morn_qty, "evening_quantity": eve_qty}
-                    response = requests.post(f"{API_URL}/variations", json=variation_data)
-                    if response.status_code == 201: st.success(f"Variation on {var_date} logged!")
-                    else: st.error("Failed to log variation.")
+            variation_form(selected_customer_details['_id'])
 
         with col_summary:
             st.subheader("Monthly Summary")
-            today = datetime.date.today()
-            sheet_month = st.selectbox("Select Month for Sheet", range(1, 13), index=today.month - 1)
-            sheet_year = st.number_input("Select Year for Sheet", value=today.year)
+            st.selectbox("Select Month for Sheet", range(1, 13), index=today.month - 1, key="sheet_month")
+            st.number_input("Select Year for Sheet", value=today.year, key="sheet_year")
         
         with st.expander("View Variations"):
-            summary_response = requests.get(f"{API_URL}/customers/{selected_customer_details['_id']}/variations_summary", params={"month": sheet_month, "year": sheet_year})
-            if summary_response.status_code == 200:
-                summary_data = summary_response.json()
+            summary_data = dashboard["variations_summary"]
+            if summary_data is not None:
                 if not summary_data: st.write("No variations found for the selected month.")
                 else:
                     for item in summary_data:
@@ -313,12 +564,11 @@ elif st.session_state.page == 'view_customer' and st.session_state.selected_cust
             st.session_state.show_log = not st.session_state.show_log
 
         if st.session_state.show_log:
-            sheet_response = requests.get(f"{API_URL}/customers/{selected_customer_details['_id']}/monthly_sheet", params={"month": sheet_month, "year": sheet_year})
-            if sheet_response.status_code == 200:
-                response_data = sheet_response.json()
-                sheet_data = response_data.get("sheet_data", [])
-                totals = response_data.get("totals", {})
+            if dashboard is not None:
+                sheet_data = dashboard.get("sheet_data", [])
+                totals = dashboard.get("totals", {})
                 if sheet_data:
+                    import pandas as pd
                     df = pd.DataFrame(sheet_data)
                     total_row = pd.DataFrame([{"Date": "---", "Morning (L)": totals.get('total_morning'), "Evening (L)": totals.get('total_evening'), "Daily Total (L)": totals.get('grand_total_liters')}])
                     df = pd.concat([df, total_row], ignore_index=True)
@@ -331,3 +581,14 @@ else:
     st.session_state.page = 'home'
 
     st.rerun()
+
+# --- Timing Panel ---
+with st.sidebar.expander("⏱️ API Timing"):
+    stats = st.session_state.api_stats
+    col_hits, col_misses = st.columns(2)
+    col_hits.metric("Cache Hits", stats["hits"])
+    col_misses.metric("Cache Misses", stats["misses"])
+    if stats["calls"]:
+        st.dataframe(stats["calls"], use_container_width=True, hide_index=True)
+        st.caption(f"Total API time this page: {sum(c['Latency (ms)'] for c in stats['calls']):.1f} ms")
+    else: st.caption("No API calls on this page.")
@@ -0,0 +1 @@
+"""Benchmarks for the Dairy Project API. See benchmarks/run.py."""
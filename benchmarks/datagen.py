@@ -0,0 +1,73 @@
+"""Seeded synthetic data for the benchmarks.
+
+The same (seed, customers, days) always produces the same documents, so two
+commits benchmarked against freshly generated data see identical inputs.
+"""
+import random
+from datetime import datetime, timedelta
+from bson import ObjectId
+from setup_database import ensure_indexes_async
+import rollups
+
+FIRST_NAMES = ["Ram", "Ramesh", "Sita", "Gita", "Mohan", "Sohan", "Priya", "Anil", "Sunita", "Kavita", "Raju", "Meena", "Vijay", "Asha", "Deepak", "Pooja"]
+LAST_NAMES = ["Sharma", "Verma", "Gupta", "Singh", "Yadav", "Patel", "Kumar", "Jain", "Mishra", "Chauhan"]
+
+# Per-day probabilities that a customer's delivery differs from their defaults
+SKIP_RATE = 0.03
+EXTRA_RATE = 0.06
+LESS_RATE = 0.03
+
+def generate_customers(count: int, rng: random.Random):
+    customers = []
+    for i in range(count):
+        customers.append({
+            # Deterministic ids so variations can reference customers before insertion
+            "_id": ObjectId(f"{i:024x}"),
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}",
+            "address": f"House {rng.randint(1, 999)}, Ward {rng.randint(1, 40)}",
+            "phone_number": f"9{rng.randint(100000000, 999999999)}",
+            "default_milk_morning": rng.choice([0.0, 0.5, 1.0, 1.0, 1.5, 2.0]),
+            "default_milk_evening": rng.choice([0.0, 0.0, 0.5, 1.0, 1.5]),
+            "price_per_liter": rng.choice([55.0, 60.0, 60.0, 65.0]),
+        })
+    return customers
+
+def generate_variations(customers, start: datetime, days: int, rng: random.Random):
+    """Yields variation documents at the module's skip/extra/less rates."""
+    for customer in customers:
+        customer_id = str(customer["_id"])
+        for offset in range(days):
+            roll = rng.random()
+            if roll < SKIP_RATE:
+                morning, evening = 0.0, 0.0
+            elif roll < SKIP_RATE + EXTRA_RATE:
+                morning = customer["default_milk_morning"] + rng.choice([0.5, 1.0])
+                evening = customer["default_milk_evening"] + rng.choice([0.0, 0.5])
+            elif roll < SKIP_RATE + EXTRA_RATE + LESS_RATE:
+                morning = max(0.0, customer["default_milk_morning"] - 0.5)
+                evening = max(0.0, customer["default_milk_evening"] - 0.5)
+            else:
+                continue
+            yield {"customer_id": customer_id, "date": start + timedelta(days=offset), "morning_quantity": morning, "evening_quantity": evening}
+
+async def load(db, customers: int, days: int, start: datetime, seed: int = 42, batch_size: int = 10_000):
+    """Replaces the customers, variations and rollups in db with generated data."""
+    rng = random.Random(seed)
+    for name in ("customers", "daily_variations", rollups.ROLLUPS_COLLECTION):
+        await db.drop_collection(name)
+    generated = generate_customers(customers, rng)
+    for i in range(0, len(generated), batch_size):
+        await db.customers.insert_many(generated[i:i + batch_size], ordered=False)
+    batch, variation_count = [], 0
+    for variation in generate_variations(generated, start, days, rng):
+        batch.append(variation)
+        if len(batch) == batch_size:
+            await db.daily_variations.insert_many(batch, ordered=False)
+            variation_count += len(batch)
+            batch = []
+    if batch:
+        await db.daily_variations.insert_many(batch, ordered=False)
+        variation_count += len(batch)
+    await ensure_indexes_async(db)
+    await rollups.rebuild_rollups(db)
+    return generated, variation_count
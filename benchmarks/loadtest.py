@@ -0,0 +1,293 @@
+"""Replays a weighted mix of API calls from concurrent agents and reports latency percentiles.
+
+    python -m benchmarks.loadtest benchmarks/scenarios/morning_burst.json
+    python -m benchmarks.loadtest benchmarks/scenarios/*.json --output benchmarks/results/load.json
+    python -m benchmarks.loadtest benchmarks/scenarios/month_end.json --serve --workers 4
+    python -m benchmarks.loadtest benchmarks/scenarios/browsing.json --url http://127.0.0.1:8000
+
+Targets:
+    (default)  the ASGI app in this process through httpx, with main.db pointed at the throwaway database
+    --serve    a uvicorn process on a free local port, started with MONGO_DB set to the throwaway database
+    --url      an already running server; nothing is seeded and customer ids come from --customer-ids
+               (a file with one id per line) or else GET /customers
+
+In the first two cases --database is seeded with benchmarks.datagen on the
+server given by --mongo-uri or BENCH_MONGO_URI, and dropped afterwards. MONGO_URI
+is never used: importing main loads .env, which points it at production.
+
+A scenario file is JSON:
+    {"name": "morning_burst", "concurrency": 50, "duration_seconds": 30, "think_ms": 0,
+     "customers": 1000, "days": 60, "mix": {"post_variation": 8, "list_customers": 1}}
+The mix keys are the names in OPERATIONS and the values their relative weights.
+
+To compare two builds, start each with uvicorn against the same database, run
+the same scenarios with --url and --output, and pass the first file to the
+second run with --compare. For the sync-vs-async comparison, use the
+concurrency_50/200/1000 scenarios, which only call routes the sync build has
+(it has no GET /customers/{id}, and its GET /customers ignores after/limit):
+
+    # The last sync build is the parent of the commit that ported the API to async
+    git worktree add ../dairy-sync "$(git log --format=%h -1 --grep='^\[user-006\] Port')~1"
+    python -m benchmarks.loadtest benchmarks/scenarios/concurrency_50.json --url http://127.0.0.1:8001 --load-only --database dairy_project
+    (cd ../dairy-sync && uvicorn main:app --port 8001 --workers 4)
+    python -m benchmarks.loadtest benchmarks/scenarios/concurrency_*.json --url http://127.0.0.1:8001 --output benchmarks/results/sync.json
+    uvicorn main:app --port 8000 --workers 4   # with MONGO_DB=dairy_project PRODUCTION_CACHE_TTL=0
+    python -m benchmarks.loadtest benchmarks/scenarios/concurrency_*.json --url http://127.0.0.1:8000 --output benchmarks/results/async.json --compare benchmarks/results/sync.json
+
+--load-only with --url loads the first scenario's data into --database on the
+benchmark MongoDB and keeps it, for a server started separately; start that
+server with MONGO_URI set to the same benchmark MongoDB. The sync build always
+uses the dairy_project database. The production cache is per process, so any
+multi-worker server needs PRODUCTION_CACHE_TTL=0; --serve sets it when --workers > 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timezone
+import httpx
+from pymongo import AsyncMongoClient
+import main
+from benchmarks import datagen
+from benchmarks.run import bench_mongo_uri, git_commit
+
+START = datetime(2025, 1, 1)
+MONTH, YEAR = 1, 2025
+# httpx caps a client at 100 connections by default; agents past that would queue in the
+# client pool, so the server never saw the load and p99 included the client-side wait
+CLIENT_LIMITS = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+
+def post_variation(rng, customer_ids):
+    quantity = rng.choice([0.0, 0.5, 1.0, 1.5, 2.0, 3.0])
+    return "POST", "/variations", {"json": {"customer_id": rng.choice(customer_ids), "date": date.today().isoformat(), "morning_quantity": quantity, "evening_quantity": quantity / 2}}
+
+def monthly_sheet(rng, customer_ids):
+    return "GET", f"/customers/{rng.choice(customer_ids)}/monthly_sheet", {"params": {"month": MONTH, "year": YEAR}}
+
+def bill(rng, customer_ids):
+    return "GET", f"/customers/{rng.choice(customer_ids)}/bill", {"params": {"month": MONTH, "year": YEAR}}
+
+def dashboard(rng, customer_ids):
+    return "GET", f"/customers/{rng.choice(customer_ids)}/dashboard", {"params": {"month": MONTH, "year": YEAR}}
+
+def list_customers(rng, customer_ids):
+    # A random page of the grid, as the Streamlit client requests it
+    return "GET", "/customers", {"params": {"fields": "_id,name", "limit": 100, "after": rng.choice(customer_ids)}}
+
+def get_customer(rng, customer_ids):
+    return "GET", f"/customers/{rng.choice(customer_ids)}", {}
+
+OPERATIONS = {f.__name__: f for f in [post_variation, monthly_sheet, bill, dashboard, list_customers, get_customer]}
+
+def load_scenario(path: str):
+    with open(path) as f:
+        scenario = json.load(f)
+    unknown = set(scenario["mix"]) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"{path}: unknown operations {sorted(unknown)}")
+    scenario.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    scenario.setdefault("concurrency", 10)
+    scenario.setdefault("duration_seconds", 30)
+    scenario.setdefault("think_ms", 0)
+    scenario.setdefault("customers", 1000)
+    scenario.setdefault("days", 60)
+    return scenario
+
+def percentile(samples, fraction: float):
+    """Nearest-rank percentile of an already sorted list."""
+    return samples[max(0, min(len(samples) - 1, int(len(samples) * fraction + 0.5) - 1))]
+
+def summarize(records, seconds: float):
+    """records: [(latency_seconds, ok)] for one operation or the whole run."""
+    latencies = sorted(r[0] for r in records)
+    errors = sum(1 for r in records if not r[1])
+    return {
+        "requests": len(records), "errors": errors, "error_rate": round(errors / len(records), 4),
+        "throughput_rps": round(len(records) / seconds, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2), "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2), "max_ms": round(latencies[-1] * 1000, 2),
+    }
+
+async def agent(http, scenario, customer_ids, deadline: float, rng: random.Random, records):
+    names = list(scenario["mix"])
+    weights = [scenario["mix"][n] for n in names]
+    think = scenario["think_ms"] / 1000
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        method, path, kwargs = OPERATIONS[name](rng, customer_ids)
+        started = time.perf_counter()
+        try:
+            response = await http.request(method, path, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        records.setdefault(name, []).append((time.perf_counter() - started, ok))
+        if think:
+            await asyncio.sleep(think)
+
+async def run_scenario(http, scenario, customer_ids, seed: int):
+    records = {}
+    started = time.perf_counter()
+    deadline = started + scenario["duration_seconds"]
+    await asyncio.gather(*(agent(http, scenario, customer_ids, deadline, random.Random(seed + i), records) for i in range(scenario["concurrency"])))
+    seconds = time.perf_counter() - started
+    operations = {name: summarize(r, seconds) for name, r in sorted(records.items())}
+    return {"concurrency": scenario["concurrency"], "seconds": round(seconds, 2),
+            "total": summarize([r for rs in records.values() for r in rs], seconds), "operations": operations}
+
+def print_table(name: str, result):
+    print(f"\n{name}: {result['concurrency']} agents for {result['seconds']}s")
+    print(f"  {'operation':<16} {'requests':>9} {'err %':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for op, s in [*result["operations"].items(), ("TOTAL", result["total"])]:
+        print(f"  {op:<16} {s['requests']:>9} {s['error_rate'] * 100:>7.2f} {s['throughput_rps']:>9.1f} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def wait_until_up(url: str, process, timeout: float = 30):
+    async with httpx.AsyncClient(base_url=url) as http:
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise SystemExit("uvicorn exited before it started serving")
+            try:
+                if (await http.get("/ready")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"uvicorn did not answer on {url} within {timeout}s")
+
+async def remote_customer_ids(http):
+    ids, after = {}, None
+    while True:
+        params = {"fields": "_id", "limit": 1000, **({"after": after} if after else {})}
+        page = (await http.get("/customers", params=params)).raise_for_status().json()
+        new = [c["_id"] for c in page if c["_id"] not in ids]
+        # An empty page ends the listing; a page with nothing new means the server ignores after/limit
+        if not new:
+            return list(ids)
+        ids.update(dict.fromkeys(new))
+        after = page[-1]["_id"]
+
+def read_customer_ids(path: str):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+async def run(args):
+    scenarios = [load_scenario(p) for p in args.scenarios]
+    results = {}
+    if args.url:
+        if args.load_only:
+            client = AsyncMongoClient(bench_mongo_uri(args.mongo_uri))
+            try:
+                await datagen.load(client[args.database], scenarios[0]["customers"], scenarios[0]["days"], START, seed=args.seed)
+            finally:
+                await client.close()
+            print(f"Seeded {args.database} with {scenarios[0]['customers']} customers x {scenarios[0]['days']} days")
+            return results
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=CLIENT_LIMITS) as http:
+            customer_ids = read_customer_ids(args.customer_ids) if args.customer_ids else await remote_customer_ids(http)
+            if not customer_ids:
+                raise SystemExit(f"{args.url} has no customers to load-test against")
+            for scenario in scenarios:
+                results[scenario["name"]] = await run_scenario(http, scenario, customer_ids, args.seed)
+                print_table(scenario["name"], results[scenario["name"]])
+        return results
+
+    mongo_uri = bench_mongo_uri(args.mongo_uri)
+    client = AsyncMongoClient(mongo_uri)
+    db = client[args.database]
+    process = None
+    try:
+        if args.serve:
+            port = free_port()
+            env = {**os.environ, "MONGO_URI": mongo_uri, "MONGO_DB": args.database}
+            if args.workers > 1:
+                env["PRODUCTION_CACHE_TTL"] = "0"
+            process = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"], env=env)
+            base_url, transport = f"http://127.0.0.1:{port}", None
+            await wait_until_up(base_url, process)
+        else:
+            # ASGITransport does not run the lifespan, so wire the app to the benchmark database directly
+            main.client, main.db = client, db
+            base_url, transport = "http://loadtest", httpx.ASGITransport(app=main.app)
+        seeded = None
+        async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=args.timeout, limits=CLIENT_LIMITS) as http:
+            for scenario in scenarios:
+                if seeded != (scenario["customers"], scenario["days"]):
+                    customers, _ = await datagen.load(db, scenario["customers"], scenario["days"], START, seed=args.seed)
+                    customer_ids = [str(c["_id"]) for c in customers]
+                    seeded = (scenario["customers"], scenario["days"])
+                    # Seeding bypasses the API, so drop anything a previous scenario cached
+                    main.production.cache.invalidate()
+                results[scenario["name"]] = await run_scenario(http, scenario, customer_ids, args.seed)
+                print_table(scenario["name"], results[scenario["name"]])
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        await client.drop_database(args.database)
+        await client.close()
+    return results
+
+def compare(baseline, current, threshold: float):
+    """Prints p99 ratios against a baseline report; returns True if anything regressed past threshold."""
+    regressed = False
+    print(f"\nCompared with {baseline['meta'].get('target')} @ {baseline['meta'].get('commit')} (p99 regression threshold {threshold:.2f}x):")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before:
+            continue
+        for op, summary in [*result["operations"].items(), ("TOTAL", result["total"])]:
+            old = before["total"] if op == "TOTAL" else before["operations"].get(op)
+            if not old:
+                continue
+            ratio = summary["p99_ms"] / old["p99_ms"] if old["p99_ms"] else float("inf")
+            flag = "  REGRESSION" if ratio > threshold else ""
+            regressed = regressed or bool(flag)
+            print(f"  {name:<16} {op:<16} p99 {old['p99_ms']:>9.2f} -> {summary['p99_ms']:>9.2f} ms  ({ratio:.2f}x)   "
+                  f"req/s {old['throughput_rps']:>8.1f} -> {summary['throughput_rps']:>8.1f}{flag}")
+    return regressed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="+", help="scenario JSON files, run in order")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="load-test an already running server")
+    target.add_argument("--serve", action="store_true", help="start a local uvicorn process instead of calling the app in-process")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --serve")
+    parser.add_argument("--mongo-uri", help="throwaway MongoDB to seed (default: BENCH_MONGO_URI)")
+    parser.add_argument("--database", default="dairy_loadtest")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--customer-ids", help="with --url, a file of customer ids (one per line) to use instead of GET /customers")
+    parser.add_argument("--load-only", action="store_true", help="with --url, only load the first scenario's data into --database and exit")
+    parser.add_argument("--timeout", type=float, default=30, help="per-request timeout in seconds")
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--compare", help="a previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.20, help="p99 ratio that counts as a regression")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(run(args))
+    report = {"meta": {"commit": git_commit(), "timestamp": datetime.now(timezone.utc).isoformat(),
+                       "target": args.url or ("uvicorn" if args.serve else "in-process"), "seed": args.seed},
+              "results": results}
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(json.load(f), report, args.threshold):
+                raise SystemExit(1)
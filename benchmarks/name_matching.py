@@ -0,0 +1,62 @@
+"""Times NameIndex construction and per-command matching.
+
+    python -m benchmarks.name_matching --names 10000 --commands 5000
+
+Exits non-zero if the p99 match time exceeds --budget-ms (default 1 ms).
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from benchmarks.datagen import FIRST_NAMES, LAST_NAMES
+from name_index import NameIndex
+
+TEMPLATES = [
+    "log 2 liters morning for {a} from 1/5/2025 to 7/5/2025",
+    "what is the bill for {a}",
+    "did {a} take extra milk this month",
+    "add 1.5 both for {a} and {b} today",
+    "show skipped days for {a}",
+]
+
+def make_customers(count: int, rng: random.Random):
+    # Deliberately overlapping names: "Ram", "Ram Sharma" and "Ram Sharma 12" all exist
+    names = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}" for i in range(count)]
+    names += FIRST_NAMES + [f"{f} {l}" for f in FIRST_NAMES for l in LAST_NAMES]
+    return [{"_id": str(i), "name": name} for i, name in enumerate(names)]
+
+def run(args):
+    rng = random.Random(args.seed)
+    customers = make_customers(args.names, rng)
+    started = time.perf_counter()
+    index = NameIndex(customers)
+    build_ms = (time.perf_counter() - started) * 1000
+    commands = [rng.choice(TEMPLATES).format(a=rng.choice(customers)["name"], b=rng.choice(customers)["name"]).lower() for _ in range(args.commands)]
+    samples = []
+    for command in commands:
+        started = time.perf_counter()
+        index.find_all(command)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "names": len(customers), "commands": len(commands), "build_ms": round(build_ms, 3),
+        "median_ms": round(statistics.median(samples), 4), "p99_ms": round(samples[int(len(samples) * 0.99) - 1], 4), "max_ms": round(samples[-1], 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--names", type=int, default=10_000)
+    parser.add_argument("--commands", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--budget-ms", type=float, default=1.0)
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args()
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if result["p99_ms"] > args.budget_ms:
+        raise SystemExit(f"p99 {result['p99_ms']} ms is over the {args.budget_ms} ms budget")
@@ -0,0 +1,182 @@
+"""Times the API handlers against generated data and saves the results as JSON.
+
+    python -m benchmarks.run --sizes 100,10000,100000 --output benchmarks/results/HEAD.json
+    python -m benchmarks.run --sizes 100 --compare benchmarks/results/main.json
+
+Whole-collection benchmarks (get_all_customers, get_all_bills) are also checked
+for linear scaling: their cost per customer may not grow by more than
+--scaling-threshold from one size to the next.
+
+Handlers are called directly (no HTTP), against a throwaway database named by
+--database on the server given by --mongo-uri or BENCH_MONGO_URI. MONGO_URI is
+never used: importing main loads .env, which points it at production.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+from pymongo import AsyncMongoClient
+import main
+from benchmarks import datagen
+
+START = datetime(2025, 1, 1)
+MONTH, YEAR = 1, 2025
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "min_ms": round(samples[0] * 1000, 3),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+    }
+
+async def measure(call, repeat: int):
+    """Awaits call(i) repeat times after one warm-up run and returns the timing summary."""
+    await call(-1)
+    samples = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        await call(i)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+def benchmarks(customer_ids, days: int, rng: random.Random):
+    """(name, call, full_collection) for every benchmarked handler."""
+    def pick():
+        return rng.choice(customer_ids)
+    first, last = START.date(), START.date() + timedelta(days=days - 1)
+    months = sorted({(d.year, d.month) for d in (first + timedelta(days=n) for n in range(days))})
+    async def statement_by_month_loop(i):
+        customer_id = pick()
+        for year, month in months:
+            await main.get_customer_bill(customer_id, month, year)
+    async def batch_statements(i):
+        await main.get_statements(main.StatementRequest(customer_ids=rng.sample(customer_ids, min(100, len(customer_ids))), start=first, end=last))
+    async def add_variation(i):
+        variation = main.Variation(customer_id=pick(), date=datetime(YEAR, MONTH, rng.randint(1, min(days, 28))), morning_quantity=rng.choice([0.0, 1.0, 2.0]), evening_quantity=rng.choice([0.0, 1.0]))
+        await main.add_variation(variation)
+    return [
+        ("get_all_customers", lambda i: main.get_all_customers(), True),
+        ("get_all_bills", lambda i: main.get_all_bills(MONTH, YEAR), True),
+        ("get_customer_bill", lambda i: main.get_customer_bill(pick(), MONTH, YEAR), False),
+        ("get_monthly_sheet_data", lambda i: main.get_monthly_sheet_data(pick(), MONTH, YEAR), False),
+        ("get_variations_summary", lambda i: main.get_variations_summary(pick(), MONTH, YEAR), False),
+        ("get_customer_statement", lambda i: main.get_customer_statement(pick(), first, last), False),
+        ("statement_by_month_loop", statement_by_month_loop, False),
+        ("get_statements_100", batch_statements, False),
+        ("add_variation", add_variation, False),
+    ]
+
+def bench_mongo_uri(explicit: str | None):
+    """--mongo-uri or BENCH_MONGO_URI; exits rather than fall back to anything else."""
+    uri = explicit or os.getenv("BENCH_MONGO_URI")
+    if not uri:
+        raise SystemExit("Pass --mongo-uri or set BENCH_MONGO_URI to a throwaway MongoDB; benchmarks seed and drop databases there")
+    return uri
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(args):
+    client = AsyncMongoClient(bench_mongo_uri(args.mongo_uri))
+    main.client, main.db = client, client[args.database]
+    results = {}
+    try:
+        for size in args.sizes:
+            print(f"--- {size} customers x {args.days} days ---")
+            started = time.perf_counter()
+            customers, variation_count = await datagen.load(main.db, size, args.days, START, seed=args.seed)
+            print(f"Loaded {variation_count} variations in {time.perf_counter() - started:.1f}s")
+            rng = random.Random(args.seed)
+            customer_ids = [str(c["_id"]) for c in customers]
+            results[str(size)] = {}
+            for name, call, full_collection in benchmarks(customer_ids, args.days, rng):
+                if args.only and name not in args.only:
+                    continue
+                summary = {**await measure(call, args.full_repeat if full_collection else args.repeat), "full_collection": full_collection}
+                results[str(size)][name] = summary
+                print(f"  {name:<24} median {summary['median_ms']:>10.3f} ms   p95 {summary['p95_ms']:>10.3f} ms")
+    finally:
+        # Also after a failed run, so the seeded database is never left behind
+        await client.drop_database(args.database)
+        await client.close()
+    return {
+        "meta": {"commit": git_commit(), "timestamp": datetime.now(timezone.utc).isoformat(), "python": platform.python_version(),
+                 "days": args.days, "seed": args.seed, "repeat": args.repeat, "full_repeat": args.full_repeat},
+        "results": results,
+    }
+
+def compare(baseline, current, threshold: float):
+    """Prints median ratios against a baseline file; returns True if anything regressed past threshold."""
+    regressed = False
+    print(f"\nCompared with {baseline['meta'].get('commit')} (regression threshold {threshold:.2f}x):")
+    for size, entries in current["results"].items():
+        for name, summary in entries.items():
+            before = baseline["results"].get(size, {}).get(name)
+            if not before:
+                continue
+            ratio = summary["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+            flag = "  REGRESSION" if ratio > threshold else ""
+            regressed = regressed or bool(flag)
+            print(f"  {size:>7} {name:<24} {before['median_ms']:>10.3f} -> {summary['median_ms']:>10.3f} ms  ({ratio:.2f}x){flag}")
+    return regressed
+
+def scaling(results, threshold: float):
+    """Prints the per-customer cost of each whole-collection benchmark; returns True if any grows superlinearly."""
+    superlinear = False
+    sizes = sorted(results["results"], key=int)
+    names = {name for size in sizes for name, summary in results["results"][size].items() if summary.get("full_collection")}
+    for name in sorted(names):
+        points = [(int(size), results["results"][size][name]["median_ms"]) for size in sizes if name in results["results"][size]]
+        if len(points) < 2:
+            continue
+        print(f"\nScaling of {name} (threshold {threshold:.2f}x per step):")
+        for (size_a, ms_a), (size_b, ms_b) in zip(points, points[1:]):
+            ratio = (ms_b / size_b) / (ms_a / size_a) if ms_a else float("inf")
+            flag = "  SUPERLINEAR" if ratio > threshold else ""
+            superlinear = superlinear or bool(flag)
+            print(f"  {size_a:>7} -> {size_b:>7} customers: {ms_a / size_a * 1000:>8.2f} -> {ms_b / size_b * 1000:>8.2f} us/customer  ({ratio:.2f}x){flag}")
+    return superlinear
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,10000,100000", type=lambda v: [int(s) for s in v.split(",")], help="customer counts to benchmark")
+    parser.add_argument("--days", type=int, default=60, help="days of variations generated per customer")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=50, help="runs per single-customer benchmark")
+    parser.add_argument("--full-repeat", type=int, default=3, help="runs per whole-collection benchmark")
+    parser.add_argument("--only", nargs="*", help="benchmark names to run")
+    parser.add_argument("--mongo-uri", help="throwaway MongoDB to seed (default: BENCH_MONGO_URI)")
+    parser.add_argument("--database", default="dairy_benchmark")
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--compare", help="a previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.10, help="median ratio that counts as a regression")
+    parser.add_argument("--scaling-threshold", type=float, default=1.5, help="growth in per-customer cost between sizes that counts as superlinear")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(run(args))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+    failed = scaling(report, args.scaling_threshold)
+    if args.compare:
+        with open(args.compare) as f:
+            failed = compare(json.load(f), report, args.threshold) or failed
+    if failed:
+        raise SystemExit(1)
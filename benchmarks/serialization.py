@@ -0,0 +1,68 @@
+"""Payload size and serialization time for the customers list and monthly sheet.
+
+    python -m benchmarks.serialization --customers 10000
+
+Compares the default path (Customer response_model validation, then
+TypeAdapter.dump_json, which is how FastAPI serializes a response_model) with
+the fast=true path (projected dicts straight into orjson), and rows vs
+columnar sheet payloads. No database is
+needed: the documents come from benchmarks.datagen.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime
+import orjson
+from pydantic import TypeAdapter
+from benchmarks import datagen
+from main import Customer, customer_json
+from sheets import build_monthly_sheet, columnar_sheet, month_bounds
+
+MONTH, YEAR = 1, 2025
+
+def time_ms(call, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        payload = call()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(statistics.median(samples), 3), "bytes": len(payload)}
+
+def run(args):
+    rng = random.Random(args.seed)
+    customers = datagen.generate_customers(args.customers, rng)
+    adapter = TypeAdapter(list[Customer])
+
+    def validated():
+        models = adapter.validate_python(customers)
+        return adapter.dump_json(models, by_alias=True)
+
+    def fast():
+        return orjson.dumps([customer_json(c) for c in customers])
+
+    num_days = month_bounds(MONTH, YEAR)[2]
+    variations = {v["date"].strftime('%Y-%m-%d'): v for v in datagen.generate_variations(customers[:1], datetime(YEAR, MONTH, 1), num_days, rng)}
+    sheet = build_monthly_sheet(customers[0], variations, num_days, MONTH, YEAR)
+    return {
+        "customers": args.customers,
+        "customers_default": time_ms(validated, args.repeat),
+        "customers_fast": time_ms(fast, args.repeat),
+        "sheet_rows": time_ms(lambda: orjson.dumps(sheet), args.repeat * 100),
+        "sheet_columnar": time_ms(lambda: orjson.dumps(columnar_sheet(sheet)), args.repeat * 100),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args()
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,105 @@
+"""Cold-start cost of the API and the Streamlit client.
+
+    python -m benchmarks.startup --runs 5 --output benchmarks/results/startup.json
+
+Import time comes from `python -X importtime` in a fresh interpreter, for
+main.py and for the modules app.py imports up front. pandas and
+streamlit_chat are measured on their own, since app.py now defers them to the
+pages that use them.
+
+Time to first response starts a uvicorn process and records when GET / first
+answers (the server is accepting) and when GET /ready first returns 200
+(the Mongo pool is warm and the indexes exist). The server is pointed at
+--mongo-uri or BENCH_MONGO_URI, never at the MONGO_URI from .env.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+from benchmarks.loadtest import free_port
+from benchmarks.run import bench_mongo_uri
+
+APP_EAGER_IMPORTS = ["streamlit", "requests", "name_index", "write_queue"]
+APP_DEFERRED_IMPORTS = ["pandas", "streamlit_chat"]
+
+def top_level_imports(code: str):
+    """{module: cumulative microseconds} for the outermost imports `python -X importtime -c code` reports."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested entries are indented and already counted in their parent's cumulative time
+        if not name[1:].startswith(" "):
+            packages[name.strip()] = int(cumulative)
+    return packages
+
+def import_time(modules, top: int = 10):
+    """Cumulative import time of `modules` in a fresh interpreter, plus the slowest top-level packages."""
+    interpreter = top_level_imports("pass")
+    packages = {name: us for name, us in top_level_imports("; ".join(f"import {m}" for m in modules)).items() if name not in interpreter}
+    total = sum(packages.values())
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {"total_ms": round(total / 1000, 1), "slowest": [{"module": name, "ms": round(us / 1000, 1)} for name, us in slowest]}
+
+def first_success(http, path: str, process, started: float, timeout: float):
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise SystemExit("uvicorn exited before it started serving")
+        try:
+            if http.get(path).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise SystemExit(f"GET {path} did not return 200 within {timeout}s")
+
+def time_to_first_response(mongo_uri: str, timeout: float):
+    port = free_port()
+    started = time.perf_counter()
+    # MONGO_URI set explicitly wins over .env, which load_dotenv does not override
+    env = {**os.environ, "MONGO_URI": mongo_uri, "MONGO_DB": "dairy_startup"}
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env=env)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as http:
+            first = first_success(http, "/", process, started, timeout)
+            ready = first_success(http, "/ready", process, started, timeout)
+    finally:
+        process.terminate()
+        process.wait()
+    return first, ready
+
+def run(args):
+    result = {
+        "api_import": import_time(["main"]),
+        "app_eager_import": import_time(APP_EAGER_IMPORTS),
+        "app_deferred_import": import_time(APP_DEFERRED_IMPORTS),
+    }
+    if not args.skip_server:
+        mongo_uri = bench_mongo_uri(args.mongo_uri)
+        samples = [time_to_first_response(mongo_uri, args.timeout) for _ in range(args.runs)]
+        result["first_response_ms"] = round(statistics.median(s[0] for s in samples) * 1000, 1)
+        result["ready_ms"] = round(statistics.median(s[1] for s in samples) * 1000, 1)
+        result["runs"] = args.runs
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="server starts to take the median of")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--skip-server", action="store_true", help="only measure import times")
+    parser.add_argument("--mongo-uri", help="throwaway MongoDB for the server (default: BENCH_MONGO_URI)")
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args()
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
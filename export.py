@@ -0,0 +1,118 @@
+"""Every customer's daily sheet for a date range, streamed as CSV or Parquet.
+
+Customers are read in _id order and daily_variations in (customer_id, date)
+order. The variations cursor is hinted to the unique (customer_id, date) index,
+so it streams in index order without an in-memory sort, rather than letting the
+planner pick the date index and sort the whole range. The two cursors are merge-joined: each customer's days are walked in
+order, taking the variation when the next one falls on that day and the
+defaults otherwise. customer_id stores the ObjectId's hex string, and hex
+strings sort the same way as the ObjectIds they encode.
+
+Rows are written out in chunks of EXPORT_CHUNK_ROWS, so memory stays bounded
+whatever the range or customer count.
+"""
+import csv
+import io
+from datetime import date, datetime, time, timedelta, timezone
+from rollups import SAME_DAY_ORDER
+from setup_database import EXPORT_HINT
+
+EXPORT_CHUNK_ROWS = 5000
+EXPORT_FIELDS = ["customer_id", "customer_name", "date", "morning_liters", "evening_liters", "total_liters", "amount"]
+
+async def iter_sheet_rows(db, start: date, end: date):
+    """One row per customer per day, ordered by customer then date."""
+    num_days = (end - start).days + 1
+    start_dt = datetime.combine(start, time(), tzinfo=timezone.utc)
+    end_dt = datetime.combine(end, time(23, 59, 59), tzinfo=timezone.utc)
+    customers = db.customers.find({}, {"name": 1, "default_milk_morning": 1, "default_milk_evening": 1, "price_per_liter": 1}).sort("_id", 1)
+    variations = db.daily_variations.find({"date": {"$gte": start_dt, "$lte": end_dt}},
+                                          {"_id": 0, "customer_id": 1, "date": 1, "morning_quantity": 1, "evening_quantity": 1}
+                                          ).sort([("customer_id", 1), *SAME_DAY_ORDER]).hint(EXPORT_HINT).batch_size(EXPORT_CHUNK_ROWS)
+    pending = await anext(variations, None)
+    async for customer in customers.batch_size(1000):
+        customer_id = str(customer["_id"])
+        # Variations for ids with no customer document sort before this one; skip them
+        while pending is not None and pending["customer_id"] < customer_id:
+            pending = await anext(variations, None)
+        price = customer["price_per_liter"]
+        for offset in range(num_days):
+            day = start + timedelta(days=offset)
+            morning, evening = customer["default_milk_morning"], customer["default_milk_evening"]
+            while pending is not None and pending["customer_id"] == customer_id and pending["date"].date() <= day:
+                if pending["date"].date() == day:
+                    morning, evening = pending["morning_quantity"], pending["evening_quantity"]
+                pending = await anext(variations, None)
+            total = morning + evening
+            yield {"customer_id": customer_id, "customer_name": customer["name"], "date": day.isoformat(),
+                   "morning_liters": morning, "evening_liters": evening, "total_liters": round(total, 2), "amount": round(total * price, 2)}
+
+async def iter_chunks(rows):
+    chunk = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) == EXPORT_CHUNK_ROWS:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+async def stream_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    async for chunk in iter_chunks(rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands its bytes out between row groups.
+
+    tell() keeps counting across drains, since the Parquet footer records absolute offsets.
+    """
+    def __init__(self):
+        self.parts, self.position = [], 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+async def stream_parquet(rows):
+    """One Parquet row group per chunk. Needs pyarrow, imported here so the CSV path never loads it."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([("customer_id", pa.string()), ("customer_name", pa.string()), ("date", pa.date32()),
+                        ("morning_liters", pa.float64()), ("evening_liters", pa.float64()), ("total_liters", pa.float64()), ("amount", pa.float64())])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        async for chunk in iter_chunks(rows):
+            columns = {field: [row[field] for row in chunk] for field in EXPORT_FIELDS}
+            columns["date"] = [date.fromisoformat(d) for d in columns["date"]]
+            writer.write_table(pa.table(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
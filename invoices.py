@@ -0,0 +1,172 @@
+"""Month-close: frozen per-customer invoices for past months.
+
+Closing a month stores each customer's full sheet, variation summary and
+totals in the invoices collection as version 1, with a SHA-256 of the
+content. Reads for a closed month are then served straight from the latest
+version instead of being recomputed: /bill, /bills, /bills/csv, /totals,
+/monthly_sheet, /variations_summary and /dashboard. Customer changes after the
+close (price, name, defaults) do not reach those reads.
+
+The range and fleet reads still recompute from daily_variations and the
+rollups, closed months included: /statement(s), /export/sheets, /production
+and /analytics/*. They describe what was delivered, not what was invoiced.
+
+Late edits to a closed month follow INVOICE_LATE_EDITS:
+    reject  the write is refused (default)
+    revise  the write goes through and a new invoice version is stored if the content changed
+
+    python invoices.py close --month 5 --year 2025 [--batch-size 500] [--concurrency 4]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timezone
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from rollups import SAME_DAY_ORDER
+from sheets import month_bounds, build_monthly_sheet, build_variations_summary
+
+INVOICES_COLLECTION = "invoices"
+LATE_EDIT_POLICY = os.getenv("INVOICE_LATE_EDITS", "reject")
+
+def is_past_month(month: int, year: int):
+    today = date.today()
+    return (year, month) < (today.year, today.month)
+
+def content_hash(content):
+    return hashlib.sha256(json.dumps(content, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+def build_invoice(customer, variations, month: int, year: int, version: int):
+    """An invoice document; variations is the {YYYY-MM-DD: variation} dict get_data_for_month returns."""
+    num_days = month_bounds(month, year)[2]
+    sheet = build_monthly_sheet(customer, variations, num_days, month, year)
+    content = {
+        "customer_name": customer["name"],
+        "price_per_liter": customer["price_per_liter"],
+        "sheet_data": sheet["sheet_data"],
+        "totals": sheet["totals"],
+        "variations_summary": build_variations_summary(customer, variations),
+    }
+    return {"customer_id": str(customer["_id"]), "year": year, "month": month, "version": version,
+            "closed_at": datetime.now(timezone.utc), "content_hash": content_hash(content), **content}
+
+async def latest_invoice(db, customer_id: str, month: int, year: int, version: int | None = None):
+    query = {"customer_id": customer_id, "year": year, "month": month}
+    if version is not None:
+        query["version"] = version
+    return await db[INVOICES_COLLECTION].find_one(query, {"_id": 0}, sort=[("version", -1)])
+
+async def closed_keys(db, keys):
+    """The subset of (customer_id, year, month) keys that already have an invoice."""
+    keys = list(keys)
+    if not keys:
+        return set()
+    cursor = db[INVOICES_COLLECTION].find({"$or": [{"customer_id": c, "year": y, "month": m} for c, y, m in keys]},
+                                          {"_id": 0, "customer_id": 1, "year": 1, "month": 1})
+    return {(i["customer_id"], i["year"], i["month"]) async for i in cursor}
+
+async def fetch_variations(db, customer_ids, month: int, year: int):
+    """{customer_id: {YYYY-MM-DD: variation}} for the month, in one query."""
+    start_date, end_date, _ = month_bounds(month, year)
+    by_customer = {c: {} for c in customer_ids}
+    cursor = db.daily_variations.find({"customer_id": {"$in": list(customer_ids)}, "date": {"$gte": start_date, "$lte": end_date}}).sort(SAME_DAY_ORDER)
+    async for v in cursor.batch_size(5000):
+        by_customer[v["customer_id"]][v["date"].strftime('%Y-%m-%d')] = v
+    return by_customer
+
+async def close_batch(db, customers, month: int, year: int):
+    """Closes the month for a batch of customers, skipping any already closed. Returns (closed, skipped)."""
+    ids = [str(c["_id"]) for c in customers]
+    already = await closed_keys(db, [(c, year, month) for c in ids])
+    pending = [c for c in customers if (str(c["_id"]), year, month) not in already]
+    if not pending:
+        return 0, len(customers)
+    variations = await fetch_variations(db, [str(c["_id"]) for c in pending], month, year)
+    documents = [build_invoice(c, variations[str(c["_id"])], month, year, version=1) for c in pending]
+    closed = len(documents)
+    try:
+        await db[INVOICES_COLLECTION].insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        # Duplicate keys mean a concurrent close got there first
+        closed -= len(e.details.get("writeErrors", []))
+    return closed, len(customers) - closed
+
+async def customer_batches(db, batch_size: int):
+    """Keyset-paginated batches of every customer, in _id order."""
+    after = None
+    while True:
+        query = {"_id": {"$gt": after}} if after is not None else {}
+        batch = await db.customers.find(query).sort("_id", 1).limit(batch_size).to_list(None)
+        if not batch:
+            return
+        yield batch
+        after = batch[-1]["_id"]
+
+async def close_month(db, month: int, year: int, batch_size: int = 500, concurrency: int = 4):
+    """Closes the month for every customer, running up to `concurrency` batches at once."""
+    # Semaphore(0) would never let a batch run, and limit(0) means no limit
+    if concurrency < 1 or batch_size < 1:
+        raise ValueError("'batch_size' and 'concurrency' must be at least 1")
+    if not is_past_month(month, year):
+        raise ValueError("Only months that have already ended can be closed")
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    async def run(batch):
+        try:
+            return await close_batch(db, batch, month, year)
+        finally:
+            semaphore.release()
+    tasks = []
+    async for batch in customer_batches(db, batch_size):
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(run(batch)))
+    results = await asyncio.gather(*tasks)
+    seconds = time.perf_counter() - started
+    closed = sum(r[0] for r in results)
+    skipped = sum(r[1] for r in results)
+    return {"month": month, "year": year, "customers": closed + skipped, "closed": closed, "already_closed": skipped, "batches": len(tasks),
+            "seconds": round(seconds, 3), "customers_per_second": round((closed + skipped) / seconds, 1) if seconds else None}
+
+async def revise_invoice(db, customer, month: int, year: int):
+    """Stores a new version for a closed month if its content changed; returns the latest invoice."""
+    customer_id = str(customer["_id"])
+    while True:
+        latest = await latest_invoice(db, customer_id, month, year)
+        variations = (await fetch_variations(db, [customer_id], month, year))[customer_id]
+        invoice = build_invoice(customer, variations, month, year, version=(latest["version"] + 1) if latest else 1)
+        if latest and latest["content_hash"] == invoice["content_hash"]:
+            return latest
+        try:
+            await db[INVOICES_COLLECTION].insert_one(invoice)
+        except DuplicateKeyError:
+            # A concurrent revision took this version number; compare against it and try the next one
+            continue
+        invoice.pop("_id", None)
+        return invoice
+
+async def run(args):
+    from main import create_client
+
+    client = create_client()
+    try:
+        report = await close_month(client.dairy_project, args.month, args.year, args.batch_size, args.concurrency)
+    finally:
+        await client.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["close"])
+    parser.add_argument("--month", type=int, required=True)
+    parser.add_argument("--year", type=int, required=True)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except ValueError as e:
+        sys.exit(str(e))
@@ -1,19 +1,61 @@
-import calendar
-from datetime import datetime, date, time, timezone
+import asyncio
+import csv
+import io
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, date, time, timedelta, timezone
 from fastapi import FastAPI, HTTPException, status
-from pymongo import MongoClient
-from pydantic import BaseModel, Field, ConfigDict
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pymongo import AsyncMongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from pydantic import BaseModel, Field, ConfigDict, field_validator
 from bson import ObjectId
-import uvicorn
 import os
+import orjson
 from dotenv import load_dotenv
-app = FastAPI()
+from setup_database import ensure_indexes_async
+from sheets import month_bounds, build_monthly_sheet, build_variations_summary, columnar_sheet
+import rollups
+import invoices
+import production
+import statements
+import export
+import analytics
+import metrics
  
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
-client: MongoClient = MongoClient(MONGO_URI)
-# Now you can directly use the client as the database object
-db = client.dairy_project
+# Set by the lifespan handler, so importing this module never opens a connection
+client: AsyncMongoClient | None = None
+db = None
+warmup: asyncio.Task | None = None
+
+def create_client():
+    """An async client sized from MONGO_MAX_POOL_SIZE / MONGO_MIN_POOL_SIZE (defaults 100 / 0)."""
+    return AsyncMongoClient(MONGO_URI, maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", "100")), minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", "0")), event_listeners=metrics.event_listeners())
+
+async def warm_up():
+    """Opens MONGO_MIN_POOL_SIZE connections (at least one) and makes sure the indexes exist."""
+    connections = max(1, int(os.getenv("MONGO_MIN_POOL_SIZE", "0")))
+    # Concurrent pings each check out their own connection, so the pool is filled rather than reusing one
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(connections)))
+    # Idempotent, so every worker can run it on boot
+    await ensure_indexes_async(db)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db, warmup
+    # Constructing the client does no I/O; warm-up runs in the background so the server starts accepting at once
+    client = create_client()
+    # MONGO_DB lets benchmarks point a server at a throwaway database
+    db = client[os.getenv("MONGO_DB", "dairy_project")]
+    warmup = asyncio.create_task(warm_up())
+    yield
+    warmup.cancel()
+    await client.close()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
 
 class PyObjectId(ObjectId):
     @classmethod
@@ -44,104 +86,508 @@ class Variation(BaseModel):
     morning_quantity: float
     evening_quantity: float
 
+    @field_validator("date")
+    @classmethod
+    def midnight_utc(cls, value: datetime):
+        """Stores every variation at midnight UTC, so a day has one row however the time was sent."""
+        return datetime.combine(stored_date(value).date(), time())
+
+class CustomerUpdate(BaseModel):
+    name: str | None = None
+    address: str | None = None
+    phone_number: str | None = None
+    default_milk_morning: float | None = None
+    default_milk_evening: float | None = None
+    price_per_liter: float | None = None
+
+class StatementRequest(BaseModel):
+    customer_ids: list[str] = Field(..., max_length=statements.MAX_STATEMENT_CUSTOMERS)
+    start: date
+    end: date
+
+MAX_BULK_VARIATIONS = 5000
+MAX_BULK_DAYS = 366
+
+class BulkVariations(BaseModel):
+    """Either an explicit list of variations, or one customer over a date range."""
+    variations: list[Variation] | None = Field(None, max_length=MAX_BULK_VARIATIONS)
+    customer_id: str | None = None
+    start_date: date | None = None
+    end_date: date | None = None
+    morning_quantity: float = 0.0
+    evening_quantity: float = 0.0
+
+    def expand(self) -> list[Variation]:
+        if self.variations is not None:
+            return self.variations
+        if not (self.customer_id and self.start_date and self.end_date):
+            raise HTTPException(status_code=422, detail="Provide either 'variations' or 'customer_id', 'start_date' and 'end_date'")
+        if self.end_date < self.start_date:
+            raise HTTPException(status_code=422, detail="'end_date' must not be before 'start_date'")
+        num_days = (self.end_date - self.start_date).days + 1
+        if num_days > MAX_BULK_DAYS:
+            raise HTTPException(status_code=422, detail=f"A bulk date range covers at most {MAX_BULK_DAYS} days")
+        return [Variation(customer_id=self.customer_id, date=datetime.combine(self.start_date + timedelta(days=i), time()), morning_quantity=self.morning_quantity, evening_quantity=self.evening_quantity) for i in range(num_days)]
+
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to the Dairy Project API"}
 
+@app.get("/ready")
+async def get_ready():
+    """Readiness probe: 200 once the pool is warm and the indexes exist, 503 until then.
+
+    A failed warm-up (e.g. Mongo was unreachable at boot) is retried on the next probe.
+    """
+    global warmup
+    if warmup is None:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    if not warmup.done():
+        return JSONResponse({"status": "warming"}, status_code=503)
+    if warmup.cancelled() or warmup.exception() is not None:
+        error = "cancelled" if warmup.cancelled() else str(warmup.exception())
+        warmup = asyncio.create_task(warm_up())
+        return JSONResponse({"status": "warming", "last_error": error}, status_code=503)
+    return {"status": "ready"}
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint; see metrics.py for METRICS_MODE."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+CUSTOMER_FIELDS = {"_id", "name", "address", "phone_number", "default_milk_morning", "default_milk_evening", "price_per_liter"}
+
+def customer_projection(fields: str | None):
+    if not fields:
+        return None
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - CUSTOMER_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown customer fields: {', '.join(sorted(unknown))}")
+    return {f: 1 for f in requested | {"_id"}}
+
+CUSTOMER_PROJECTION = {f: 1 for f in CUSTOMER_FIELDS}
+
+def customer_json(customer):
+    return {**customer, "_id": str(customer["_id"])}
+
+def orjson_response(content, status_code: int = 200):
+    # FastAPI deprecates ORJSONResponse; this is the same orjson call in a plain Response
+    return Response(orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY), status_code=status_code, media_type="application/json")
+
+def respond(content, fast: bool, status_code: int = 200):
+    """With fast=true, skips response_model validation and FastAPI's encoder and serializes with orjson.
+
+    Only for data we read from our own collections (already valid), projected to the output fields.
+    """
+    return orjson_response(content, status_code) if fast else content
+
+def sheet_payload(sheet, format: str):
+    if format == "columnar":
+        return columnar_sheet(sheet)
+    if format != "rows":
+        raise HTTPException(status_code=400, detail="'format' must be 'rows' or 'columnar'")
+    return sheet
+
 @app.get("/customers", response_model=list[Customer])
-def get_all_customers():
-    customers = list(db.customers.find())
+async def get_all_customers(after: str | None = None, limit: int | None = None, fields: str | None = None, format: str = "json", fast: bool = False):
+    """Lists customers in _id order.
+
+    Pages are keyset-based: pass the last `_id` of one page as `after` to get the
+    next. `fields=_id,name` limits the returned fields, and `format=ndjson`
+    streams one customer per line without holding the collection in memory.
+    `fast=true` projects to the Customer fields and skips revalidation.
+    """
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="'format' must be 'json' or 'ndjson'")
+    query = {}
+    if after is not None:
+        if not ObjectId.is_valid(after):
+            raise HTTPException(status_code=400, detail="Invalid 'after' cursor")
+        query["_id"] = {"$gt": ObjectId(after)}
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="'limit' must be positive")
+    projection = customer_projection(fields)
+    if fast and projection is None:
+        projection = CUSTOMER_PROJECTION
+    cursor = db.customers.find(query, projection).sort("_id", 1)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    if format == "ndjson":
+        async def generate():
+            async for customer in cursor.batch_size(1000):
+                yield json.dumps(customer_json(customer)) + "\n"
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+    customers = await cursor.to_list(None)
+    if fast:
+        return orjson_response([customer_json(c) for c in customers])
+    if projection:
+        # Partial documents would fail Customer validation
+        return JSONResponse([customer_json(c) for c in customers])
     return customers
 
+@app.get("/customers/{customer_id}", response_model=Customer)
+async def get_customer(customer_id: str, fast: bool = False):
+    if not ObjectId.is_valid(customer_id):
+        raise HTTPException(status_code=400, detail="Invalid Customer ID format")
+    customer = await db.customers.find_one({"_id": ObjectId(customer_id)}, CUSTOMER_PROJECTION if fast else None)
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return respond(customer_json(customer), fast)
+
 @app.post("/customers", status_code=status.HTTP_201_CREATED, response_model=Customer)
-def create_customer(customer: Customer):
+async def create_customer(customer: Customer, fast: bool = False):
     customer_dict = customer.model_dump(by_alias=True, exclude={"id"})
-    result = db.customers.insert_one(customer_dict)
-    created_customer = db.customers.find_one({"_id": result.inserted_id})
+    result = await db.customers.insert_one(customer_dict)
+    production.cache.invalidate()
+    if fast:
+        # The body was validated on the way in and insert_one added the _id, so there is nothing to re-read
+        return respond(customer_json(customer_dict), fast, status.HTTP_201_CREATED)
+    created_customer = await db.customers.find_one({"_id": result.inserted_id})
     return created_customer
 
+@app.patch("/customers/{customer_id}", response_model=Customer)
+async def update_customer(customer_id: str, update: CustomerUpdate):
+    if not ObjectId.is_valid(customer_id):
+        raise HTTPException(status_code=400, detail="Invalid Customer ID format")
+    changes = update.model_dump(exclude_none=True)
+    if not changes:
+        customer = await db.customers.find_one({"_id": ObjectId(customer_id)})
+        if not customer:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        return customer
+    previous = await db.customers.find_one_and_update({"_id": ObjectId(customer_id)}, {"$set": changes})
+    if not previous:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    updated = {**previous, **changes}
+    await rollups.apply_customer_change(db, previous, updated)
+    production.cache.invalidate()
+    return updated
+
+def stored_date(value: datetime):
+    """The naive UTC datetime pymongo hands back for a stored date."""
+    if value.tzinfo:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+async def revise_closed_months(keys):
+    """Re-freezes closed (customer_id, year, month) keys after a late edit under the 'revise' policy."""
+    customer_ids = {c for c, _, _ in keys if ObjectId.is_valid(c)}
+    customers = {str(c["_id"]): c async for c in db.customers.find({"_id": {"$in": [ObjectId(c) for c in customer_ids]}})}
+    for customer_id, year, month in keys:
+        if customer_id in customers:
+            await invoices.revise_invoice(db, customers[customer_id], month, year)
+
 @app.post("/variations", status_code=status.HTTP_201_CREATED)
-def add_variation(variation: Variation):
+async def add_variation(variation: Variation):
     variation_dict = variation.model_dump()
-    db.daily_variations.update_one({"customer_id": variation.customer_id, "date": variation.date}, {"$set": variation_dict}, upsert=True)
+    day = stored_date(variation.date)
+    closed = await invoices.closed_keys(db, [(variation.customer_id, day.year, day.month)])
+    if closed and invoices.LATE_EDIT_POLICY == "reject":
+        raise HTTPException(status_code=409, detail=f"{day.year}-{day.month:02d} is closed for this customer")
+    previous = await db.daily_variations.find_one_and_update({"customer_id": variation.customer_id, "date": variation.date}, {"$set": variation_dict}, upsert=True, return_document=ReturnDocument.BEFORE)
+    await rollups.apply_variation_changes(db, [(previous, {**variation_dict, "date": stored_date(variation.date)})])
+    production.cache.invalidate([day.date()])
+    if closed:
+        await revise_closed_months(closed)
     return {"message": "Variation recorded successfully"}
 
-def get_data_for_month(customer_id: str, month: int, year: int):
+@app.post("/variations/bulk", status_code=status.HTTP_201_CREATED)
+async def add_variations_bulk(bulk: BulkVariations):
+    """Upserts many variations with a single unordered bulk_write."""
+    variations = bulk.expand()
+    if not variations:
+        return {"message": "No variations to record", "recorded": 0, "failed": 0, "results": []}
+    month_keys = [(v.customer_id, stored_date(v.date).year, stored_date(v.date).month) for v in variations]
+    closed = await invoices.closed_keys(db, set(month_keys))
+    errors = {}
+    if invoices.LATE_EDIT_POLICY == "reject":
+        errors = {index: f"{key[1]}-{key[2]:02d} is closed for this customer" for index, key in enumerate(month_keys) if key in closed}
+    writable = [index for index in range(len(variations)) if index not in errors]
+    if writable:
+        operations = [UpdateOne({"customer_id": variations[i].customer_id, "date": variations[i].date}, {"$set": variations[i].model_dump()}, upsert=True) for i in writable]
+        # Read the rows about to be overwritten so the rollups can be moved by the difference
+        dates_by_customer = {}
+        for i in writable:
+            dates_by_customer.setdefault(variations[i].customer_id, []).append(variations[i].date)
+        existing = db.daily_variations.find({"$or": [{"customer_id": c, "date": {"$in": dates}} for c, dates in dates_by_customer.items()]})
+        latest = {(v["customer_id"], v["date"]): v async for v in existing}
+        try:
+            await db.daily_variations.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors.update({writable[err["index"]]: err.get("errmsg", "write failed") for err in e.details.get("writeErrors", [])})
+    changes = []
+    for index, v in enumerate(variations):
+        if index in errors:
+            continue
+        new = {**v.model_dump(), "date": stored_date(v.date)}
+        key = (v.customer_id, new["date"])
+        changes.append((latest.get(key), new))
+        latest[key] = new
+    await rollups.apply_variation_changes(db, changes)
+    production.cache.invalidate({new["date"].date() for _, new in changes})
+    revised = {month_keys[index] for index in writable if index not in errors} & closed
+    if revised:
+        await revise_closed_months(revised)
+    results = []
+    for index, v in enumerate(variations):
+        item = {"index": index, "customer_id": v.customer_id, "date": v.date.date().isoformat(), "ok": index not in errors}
+        if index in errors:
+            item["error"] = errors[index]
+        results.append(item)
+    return {"message": "Variations recorded", "recorded": len(variations) - len(errors), "failed": len(errors), "results": results}
+
+async def get_data_for_month(customer_id: str, month: int, year: int):
     try:
         obj_id = ObjectId(customer_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid Customer ID format")
-    customer = db.customers.find_one({"_id": obj_id})
+    customer = await db.customers.find_one({"_id": obj_id})
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
-    start_date = datetime(year, month, 1, tzinfo=timezone.utc)
-    num_days = calendar.monthrange(year, month)[1]
-    end_date = datetime(year, month, num_days, 23, 59, 59, tzinfo=timezone.utc)
-    variations_cursor = db.daily_variations.find({"customer_id": customer_id, "date": {"$gte": start_date, "$lte": end_date}})
-    variations = {v["date"].strftime('%Y-%m-%d'): v for v in variations_cursor}
+    start_date, end_date, num_days = month_bounds(month, year)
+    variations_cursor = db.daily_variations.find({"customer_id": customer_id, "date": {"$gte": start_date, "$lte": end_date}}).sort(rollups.SAME_DAY_ORDER)
+    variations = {v["date"].strftime('%Y-%m-%d'): v async for v in variations_cursor}
     return customer, variations, num_days
 
+async def get_month_totals(customer_id: str, month: int, year: int):
+    if not ObjectId.is_valid(customer_id):
+        raise HTTPException(status_code=400, detail="Invalid Customer ID format")
+    totals = await rollups.get_month_totals(db, customer_id, month, year)
+    if not totals:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return totals
+
+async def closed_invoice(customer_id: str, month: int, year: int):
+    """The latest invoice if this customer's month is closed, else None."""
+    if not ObjectId.is_valid(customer_id):
+        raise HTTPException(status_code=400, detail="Invalid Customer ID format")
+    if not invoices.is_past_month(month, year):
+        return None
+    return await invoices.latest_invoice(db, customer_id, month, year)
+
 @app.get("/customers/{customer_id}/bill")
-def get_customer_bill(customer_id: str, month: int, year: int):
-    customer, variations, num_days = get_data_for_month(customer_id, month, year)
-    total_liters = 0.0
-    for day_num in range(1, num_days + 1):
-        current_date_str = date(year, month, day_num).isoformat()
-        if current_date_str in variations:
-            total_liters += variations[current_date_str]["morning_quantity"]
-            total_liters += variations[current_date_str]["evening_quantity"]
-        else:
-            total_liters += customer["default_milk_morning"]
-            total_liters += customer["default_milk_evening"]
-    amount_due = total_liters * customer["price_per_liter"]
-    return {"customer_name": customer["name"], "month": month, "year": year, "total_liters": round(total_liters, 2), "amount_due": round(amount_due, 2)}
+async def get_customer_bill(customer_id: str, month: int, year: int):
+    invoice = await closed_invoice(customer_id, month, year)
+    if invoice:
+        return {"customer_name": invoice["customer_name"], "month": month, "year": year, "total_liters": invoice["totals"]["grand_total_liters"], "amount_due": invoice["totals"]["amount_due"]}
+    totals = await get_month_totals(customer_id, month, year)
+    total_liters = totals["total_morning"] + totals["total_evening"]
+    amount_due = total_liters * totals["price_per_liter"]
+    return {"customer_name": totals["customer_name"], "month": month, "year": year, "total_liters": round(total_liters, 2), "amount_due": round(amount_due, 2)}
+
+@app.get("/customers/{customer_id}/totals")
+async def get_customer_totals(customer_id: str, month: int, year: int):
+    """Full-month totals read straight from the monthly rollup, or from the invoice once the month is closed."""
+    invoice = await closed_invoice(customer_id, month, year)
+    if invoice:
+        summary = invoice["variations_summary"]
+        return {**{key: invoice["totals"][key] for key in ("total_morning", "total_evening", "grand_total_liters", "amount_due")},
+                "variation_count": len(summary), "skip_count": sum(1 for v in summary if v["total"] == 0)}
+    totals = await get_month_totals(customer_id, month, year)
+    grand_total = totals["total_morning"] + totals["total_evening"]
+    return {"total_morning": round(totals["total_morning"], 2), "total_evening": round(totals["total_evening"], 2), "grand_total_liters": round(grand_total, 2), "amount_due": round(grand_total * totals["price_per_liter"], 2), "variation_count": totals["variation_count"], "skip_count": totals["skip_count"]}
 
 @app.get("/customers/{customer_id}/monthly_sheet")
-def get_monthly_sheet_data(customer_id: str, month: int, year: int):
-    customer, variations, num_days = get_data_for_month(customer_id, month, year)
-    sheet_data = []
-    today = date.today()
-    days_to_show = num_days
-    if year == today.year and month == today.month:
-        days_to_show = today.day
-    total_morning, total_evening = 0.0, 0.0
-    for day_num in range(1, days_to_show + 1):
-        current_date_str = date(year, month, day_num).isoformat()
-        if current_date_str in variations:
-            morning_qty = variations[current_date_str]["morning_quantity"]
-            evening_qty = variations[current_date_str]["evening_quantity"]
-        else:
-            morning_qty = customer["default_milk_morning"]
-            evening_qty = customer["default_milk_evening"]
-        daily_total = morning_qty + evening_qty
-        total_morning += morning_qty
-        total_evening += evening_qty
-        sheet_data.append({"Date": current_date_str, "Morning (L)": morning_qty, "Evening (L)": evening_qty, "Daily Total (L)": daily_total})
-    grand_total = total_morning + total_evening
-    return {"sheet_data": sheet_data, "totals": {"total_morning": round(total_morning, 2), "total_evening": round(total_evening, 2), "grand_total_liters": round(grand_total, 2), "amount_due": round(grand_total * customer["price_per_liter"], 2)}}
+async def get_monthly_sheet_data(customer_id: str, month: int, year: int, format: str = "rows", fast: bool = False):
+    """`format=columnar` returns one array per column instead of one dict per day."""
+    invoice = await closed_invoice(customer_id, month, year)
+    if invoice:
+        return respond(sheet_payload({"sheet_data": invoice["sheet_data"], "totals": invoice["totals"]}, format), fast)
+    customer, variations, num_days = await get_data_for_month(customer_id, month, year)
+    return respond(sheet_payload(build_monthly_sheet(customer, variations, num_days, month, year), format), fast)
 
 @app.get("/customers/{customer_id}/variations_summary")
-def get_variations_summary(customer_id: str, month: int, year: int):
+async def get_variations_summary(customer_id: str, month: int, year: int):
     """Fetches only the dates with variations for a given customer and month."""
-    customer, variations, num_days = get_data_for_month(customer_id, month, year)
-    
-    summary_data = []
-    for date_str, variation_data in variations.items():
-        summary_data.append({
-            "date": date_str,
-            "morning": variation_data["morning_quantity"],
-            "evening": variation_data["evening_quantity"],
-            "total": variation_data["morning_quantity"] + variation_data["evening_quantity"],
-            # Add the default values to the response
-            "default_morning": customer["default_milk_morning"],
-            "default_evening": customer["default_milk_evening"]
-        })
-        
-    summary_data.sort(key=lambda x: x['date'])
-    return summary_data
-
-import uvicorn
+    invoice = await closed_invoice(customer_id, month, year)
+    if invoice:
+        return invoice["variations_summary"]
+    customer, variations, num_days = await get_data_for_month(customer_id, month, year)
+    return build_variations_summary(customer, variations)
+
+@app.get("/customers/{customer_id}/dashboard")
+async def get_customer_dashboard(customer_id: str, month: int, year: int, format: str = "rows", fast: bool = False):
+    """Profile, variation summary, monthly sheet and totals from a single get_data_for_month pass."""
+    invoice = await closed_invoice(customer_id, month, year)
+    if invoice:
+        customer = await db.customers.find_one({"_id": ObjectId(customer_id)}, CUSTOMER_PROJECTION)
+        if not customer:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        summary, sheet = invoice["variations_summary"], {"sheet_data": invoice["sheet_data"], "totals": invoice["totals"]}
+    else:
+        customer, variations, num_days = await get_data_for_month(customer_id, month, year)
+        summary, sheet = build_variations_summary(customer, variations), build_monthly_sheet(customer, variations, num_days, month, year)
+    return respond({"customer": customer_json(customer), "variations_summary": summary, **sheet_payload(sheet, format)}, fast)
+
+@app.post("/invoices/close")
+async def close_month(month: int, year: int, batch_size: int = 500, concurrency: int = 4):
+    """Freezes every customer's sheet for a finished month into the invoices collection."""
+    try:
+        return await invoices.close_month(db, month, year, batch_size, concurrency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/customers/{customer_id}/invoice")
+async def get_customer_invoice(customer_id: str, month: int, year: int, version: int | None = None):
+    if not ObjectId.is_valid(customer_id):
+        raise HTTPException(status_code=400, detail="Invalid Customer ID format")
+    invoice = await invoices.latest_invoice(db, customer_id, month, year, version)
+    if not invoice:
+        raise HTTPException(status_code=404, detail="No invoice for this month")
+    return invoice
+
+def check_statement_range(start: date, end: date):
+    if end < start:
+        raise HTTPException(status_code=400, detail="'end' must not be before 'start'")
+    if (end - start).days + 1 > statements.MAX_STATEMENT_DAYS:
+        raise HTTPException(status_code=400, detail=f"Statements cover at most {statements.MAX_STATEMENT_DAYS} days")
+
+@app.get("/customers/{customer_id}/statement")
+async def get_customer_statement(customer_id: str, start: date, end: date):
+    """Per-month subtotals and grand total for any date range, from one variations query."""
+    check_statement_range(start, end)
+    if not ObjectId.is_valid(customer_id):
+        raise HTTPException(status_code=400, detail="Invalid Customer ID format")
+    customer = await db.customers.find_one({"_id": ObjectId(customer_id)})
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return (await statements.build_statements(db, [customer], start, end))[0]
+
+@app.post("/statements")
+async def get_statements(request: StatementRequest):
+    """Statements for many customers over the same range, still one variations query."""
+    check_statement_range(request.start, request.end)
+    customer_ids = list(dict.fromkeys(request.customer_ids))
+    invalid = [c for c in customer_ids if not ObjectId.is_valid(c)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid Customer ID format: {', '.join(invalid)}")
+    customers = await statements.fetch_customers(db, customer_ids)
+    found = {str(c["_id"]) for c in customers}
+    return {"statements": await statements.build_statements(db, customers, request.start, request.end), "not_found": [c for c in customer_ids if c not in found]}
+
+@app.get("/production")
+async def get_production(date: date | None = None, start: date | None = None, end: date | None = None):
+    """Liters to prepare for the morning and evening runs, for one date or a range."""
+    if date is not None:
+        return (await production.get_production(db, date, date))[0]
+    if start is None or end is None:
+        raise HTTPException(status_code=400, detail="Provide either 'date' or both 'start' and 'end'")
+    if end < start:
+        raise HTTPException(status_code=400, detail="'end' must not be before 'start'")
+    if (end - start).days + 1 > production.MAX_PRODUCTION_DAYS:
+        raise HTTPException(status_code=400, detail=f"Production ranges cover at most {production.MAX_PRODUCTION_DAYS} days")
+    days = await production.get_production(db, start, end)
+    total_morning = sum(d["morning_liters"] for d in days)
+    total_evening = sum(d["evening_liters"] for d in days)
+    return {"start": start.isoformat(), "end": end.isoformat(), "days": days, "total_morning": round(total_morning, 2), "total_evening": round(total_evening, 2), "total_liters": round(total_morning + total_evening, 2)}
+
+@app.get("/analytics/top_customers")
+async def get_top_customers(month: int, year: int, metric: str = "extra_liters", limit: int = 10):
+    """Customers ranked by a monthly rollup figure, e.g. metric=extra_liters or skip_count."""
+    if metric not in analytics.RANKING_METRICS:
+        raise HTTPException(status_code=400, detail=f"'metric' must be one of {', '.join(sorted(analytics.RANKING_METRICS))}")
+    return await analytics.top_customers(db, month, year, metric, max(1, min(limit, 1000)))
+
+@app.get("/analytics/skippers")
+async def get_frequent_skippers(month: int, year: int, min_skips: int = 0, limit: int = 100):
+    """Customers who skipped more than min_skips days in the month."""
+    return await analytics.frequent_skippers(db, month, year, min_skips, max(1, min(limit, 1000)))
+
+@app.get("/analytics/trend")
+async def get_consumption_trend(month: int, year: int, months: int = 6):
+    """Fleet liters and amount per month for the months ending at month/year, with month-over-month change."""
+    if not 1 <= months <= analytics.MAX_TREND_MONTHS:
+        raise HTTPException(status_code=400, detail=f"'months' must be between 1 and {analytics.MAX_TREND_MONTHS}")
+    return await analytics.consumption_trend(db, month, year, months)
+
+def bills_pipeline(month: int, year: int):
+    """One pass over customers, joining each one's monthly rollup by _id.
+
+    The totals come from the same rollup fields (or the same defaults x num_days
+    when there is no rollup) that get_customer_bill reads, and iter_bills does the
+    same float arithmetic, so every row equals that customer's /bill exactly.
+    For a past month the latest invoice version is joined too, and wins, as it
+    does in get_customer_bill.
+    """
+    num_days = month_bounds(month, year)[2]
+    pipeline = [
+        {"$addFields": {"cid": {"$toString": "$_id"}}},
+        {"$addFields": {"rollup_id": {"$concat": ["$cid", f":{year}:{month}"]}}},
+        {"$lookup": {"from": rollups.ROLLUPS_COLLECTION, "localField": "rollup_id", "foreignField": "_id", "as": "rollup"}},
+        {"$unwind": {"path": "$rollup", "preserveNullAndEmptyArrays": True}},
+    ]
+    invoice_fields = {}
+    if invoices.is_past_month(month, year):
+        pipeline += [
+            {"$lookup": {"from": invoices.INVOICES_COLLECTION, "localField": "cid", "foreignField": "customer_id", "as": "invoice",
+                         "pipeline": [{"$match": {"year": year, "month": month}}, {"$sort": {"version": -1}}, {"$limit": 1},
+                                      {"$project": {"_id": 0, "customer_name": 1, "totals": 1}}]}},
+            {"$unwind": {"path": "$invoice", "preserveNullAndEmptyArrays": True}},
+        ]
+        invoice_fields = {"invoice_totals": "$invoice.totals"}
+    pipeline += [
+        {"$project": {
+            "_id": 0,
+            "customer_id": "$cid",
+            "customer_name": {"$ifNull": ["$invoice.customer_name", "$rollup.customer_name", "$name"]},
+            "price_per_liter": {"$ifNull": ["$rollup.price_per_liter", "$price_per_liter"]},
+            "total_morning": {"$ifNull": ["$rollup.total_morning", {"$multiply": ["$default_milk_morning", num_days]}]},
+            "total_evening": {"$ifNull": ["$rollup.total_evening", {"$multiply": ["$default_milk_evening", num_days]}]},
+            **invoice_fields,
+        }},
+        {"$sort": {"customer_name": 1, "customer_id": 1}},
+    ]
+    return pipeline
+
+async def iter_bills(month: int, year: int):
+    async for row in await db.customers.aggregate(bills_pipeline(month, year), allowDiskUse=True):
+        invoice_totals = row.get("invoice_totals")
+        if invoice_totals:
+            yield {"customer_id": row["customer_id"], "customer_name": row["customer_name"], "month": month, "year": year, "total_liters": invoice_totals["grand_total_liters"], "amount_due": invoice_totals["amount_due"]}
+            continue
+        total_liters = row["total_morning"] + row["total_evening"]
+        yield {"customer_id": row["customer_id"], "customer_name": row["customer_name"], "month": month, "year": year, "total_liters": round(total_liters, 2), "amount_due": round(total_liters * row["price_per_liter"], 2)}
+
+@app.get("/bills")
+async def get_all_bills(month: int, year: int, fast: bool = False):
+    """Every customer's bill for a month, built from a single aggregation."""
+    return respond([bill async for bill in iter_bills(month, year)], fast)
+
+@app.get("/bills/csv")
+async def get_all_bills_csv(month: int, year: int):
+    """Same as /bills, streamed as CSV one row at a time."""
+    fields = ["customer_id", "customer_name", "month", "year", "total_liters", "amount_due"]
+    async def generate():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields)
+        writer.writeheader()
+        async for bill in iter_bills(month, year):
+            writer.writerow(bill)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        yield buffer.getvalue()
+    headers = {"Content-Disposition": f'attachment; filename="bills_{year}_{month:02d}.csv"'}
+    return StreamingResponse(generate(), media_type="text/csv", headers=headers)
+
+@app.get("/export/sheets")
+async def export_sheets(start: date, end: date, format: str = "csv"):
+    """Every customer's daily sheet for [start, end], streamed in chunks as CSV or Parquet."""
+    if end < start:
+        raise HTTPException(status_code=400, detail="'end' must not be before 'start'")
+    rows = export.iter_sheet_rows(db, start, end)
+    filename = f"sheets_{start.isoformat()}_{end.isoformat()}"
+    if format == "csv":
+        return StreamingResponse(export.stream_csv(rows), media_type="text/csv", headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'})
+    if format == "parquet":
+        if not export.parquet_available():
+            raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed on the server")
+        return StreamingResponse(export.stream_parquet(rows), media_type="application/vnd.apache.parquet", headers={"Content-Disposition": f'attachment; filename="{filename}.parquet"'})
+    raise HTTPException(status_code=400, detail="'format' must be 'csv' or 'parquet'")
 
 if __name__ == "__main__":
+    import uvicorn
+
     print("--- Starting FastAPI Server ---")
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
@@ -0,0 +1,188 @@
+"""Request and MongoDB instrumentation, exposed in Prometheus text format.
+
+METRICS_MODE controls the overhead:
+    off    nothing is recorded
+    basic  per-route latency histograms and per-collection Mongo command stats (default, safe to leave on)
+    full   basic plus cProfile of a sample of requests; any sampled request slower than
+           PROFILE_SLOW_SECONDS is dumped to PROFILE_DIR as a .prof file
+
+Each request also records how much of its time was spent waiting on Mongo, so
+slow routes can be split into database time and Python/serialization time.
+"""
+import bisect
+import contextvars
+import cProfile
+import os
+import random
+import threading
+import time
+from pymongo import monitoring
+
+MODE = os.getenv("METRICS_MODE", "basic")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+PROFILE_SLOW_SECONDS = float(os.getenv("PROFILE_SLOW_SECONDS", "0.5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Mongo seconds spent by the current request; set per request by the middleware
+_request_mongo_time = contextvars.ContextVar("request_mongo_time", default=None)
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+
+class Registry:
+    """Counters and histograms keyed by (metric name, label tuple)."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+
+    def describe(self, name: str, kind: str, text: str):
+        self.help[name] = (kind, text)
+
+    def inc(self, name: str, labels: tuple, amount: float = 1):
+        with self.lock:
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, labels: tuple, value: float):
+        with self.lock:
+            key = (name, labels)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h.counts), h.total)) for key, h in self.histograms.items())
+        described = set()
+        for (name, labels), value in counters:
+            if name not in described:
+                described.add(name)
+                lines += self._header(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), (counts, total) in histograms:
+            if name not in described:
+                described.add(name)
+                lines += self._header(name)
+            cumulative = 0
+            for bound, count in zip(BUCKETS, counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, name: str):
+        kind, text = self.help.get(name, ("untyped", ""))
+        return [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: tuple):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+registry = Registry()
+registry.describe("dairy_http_requests_total", "counter", "HTTP requests by route and status.")
+registry.describe("dairy_http_request_duration_seconds", "histogram", "HTTP request latency by route.")
+registry.describe("dairy_http_request_mongo_seconds", "histogram", "Time each request spent waiting on MongoDB, by route.")
+registry.describe("dairy_mongo_commands_total", "counter", "MongoDB commands by collection, command and outcome.")
+registry.describe("dairy_mongo_command_duration_seconds", "histogram", "MongoDB command latency by collection and command.")
+registry.describe("dairy_profiles_dumped_total", "counter", "cProfile dumps written for slow sampled requests.")
+
+class CommandMetrics(monitoring.CommandListener):
+    """Records every driver command; register via MongoClient(event_listeners=[...])."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            # getMore carries the cursor id under the command name
+            collection = event.command.get("collection", "")
+        with self.lock:
+            self.collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+    def _finish(self, event, outcome: str):
+        with self.lock:
+            collection = self.collections.pop((event.connection_id, event.request_id), "")
+        seconds = event.duration_micros / 1e6
+        registry.inc("dairy_mongo_commands_total", (("collection", collection), ("command", event.command_name), ("outcome", outcome)))
+        registry.observe("dairy_mongo_command_duration_seconds", (("collection", collection), ("command", event.command_name)), seconds)
+        request_time = _request_mongo_time.get()
+        if request_time is not None:
+            request_time[0] += seconds
+
+command_listener = CommandMetrics()
+_profiling = threading.Lock()
+
+class MetricsMiddleware:
+    """Plain ASGI middleware, so the handler runs in the same task and context as the timer."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or MODE == "off":
+            return await self.app(scope, receive, send)
+        status_code = [500]
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        mongo_time = [0.0]
+        token = _request_mongo_time.set(mongo_time)
+        # Only one profiler can be active per interpreter
+        profiler = None
+        if MODE == "full" and random.random() < PROFILE_SAMPLE_RATE and _profiling.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            profiler.enable()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_mongo_time.reset(token)
+            # Label by route template, not raw path, to keep the series count bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            labels = (("method", scope["method"]), ("route", route))
+            registry.inc("dairy_http_requests_total", labels + (("status", status_code[0]),))
+            registry.observe("dairy_http_request_duration_seconds", labels, elapsed)
+            registry.observe("dairy_http_request_mongo_seconds", labels, mongo_time[0])
+            if profiler:
+                profiler.disable()
+                _profiling.release()
+                if elapsed >= PROFILE_SLOW_SECONDS:
+                    dump_profile(profiler, route, elapsed)
+
+def dump_profile(profiler, route: str, elapsed: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{int(time.time())}_{slug}_{elapsed * 1000:.0f}ms.prof"))
+    registry.inc("dairy_profiles_dumped_total", (("route", route),))
+
+def event_listeners():
+    """Listeners to pass to the Mongo client for the current MODE."""
+    return [] if MODE == "off" else [command_listener]
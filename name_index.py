@@ -0,0 +1,65 @@
+"""Whole-word customer name matching for the assistant.
+
+Names are split into lowercase word tokens and stored in a token trie. A
+command is scanned left to right; at each word the trie is walked as far as it
+goes and the longest complete name wins, so "ramesh" never matches "ram" and
+"ram kumar" beats "ram". Matching costs O(words in command x words per name),
+independent of how many customers there are.
+"""
+import unicodedata
+
+def _word_char(c: str):
+    # Letters and digits in any script, plus combining marks: \w alone splits Devanagari at its vowel signs
+    return c.isalnum() or unicodedata.category(c).startswith("M")
+
+def tokenize(text: str):
+    text = unicodedata.normalize("NFC", text).casefold()
+    return "".join(c if _word_char(c) else " " for c in text).split()
+
+class NameIndex:
+    def __init__(self, customers):
+        # Each node is a dict of token -> child node; the None key holds the customers whose name ends there
+        self.root = {}
+        for customer in customers:
+            tokens = tokenize(customer["name"])
+            if not tokens:
+                continue
+            node = self.root
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node.setdefault(None, []).append(customer)
+
+    def _longest_at(self, tokens, start: int):
+        """(end, customers) of the longest name starting at tokens[start], or None."""
+        node, best = self.root, None
+        for end in range(start, len(tokens)):
+            node = node.get(tokens[end])
+            if node is None:
+                break
+            if None in node:
+                best = (end + 1, node[None])
+        return best
+
+    def find_all(self, command: str):
+        """Customers named in the command, in order of mention, using non-overlapping longest matches.
+
+        When several customers share a name, the first one loaded is returned.
+        """
+        tokens = tokenize(command)
+        matches, seen, position = [], set(), 0
+        while position < len(tokens):
+            match = self._longest_at(tokens, position)
+            if match is None:
+                position += 1
+                continue
+            position, customers = match
+            customer = customers[0]
+            if customer["_id"] not in seen:
+                seen.add(customer["_id"])
+                matches.append(customer)
+        return matches
+
+    def find(self, command: str):
+        """The first customer named in the command, or None."""
+        matches = self.find_all(command)
+        return matches[0] if matches else None
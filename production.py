@@ -0,0 +1,95 @@
+"""Fleet-wide liters to prepare per delivery run.
+
+A day's production is the sum of every customer's defaults, adjusted by that
+day's variations (logged quantity minus the customer's default). Both halves
+come from one aggregate command: the default sums over customers, and a
+$unionWith branch that turns the range's variations into per-day deltas.
+
+Results are cached per date in-process. Writing a variation drops that date;
+creating or updating a customer drops everything, since defaults feed every day.
+The cache is only coherent with a single worker process: other workers never
+see the invalidation and serve the old numbers until CACHE_TTL_SECONDS runs out.
+Run uvicorn with one worker, or set PRODUCTION_CACHE_TTL=0 to turn the cache off.
+"""
+import os
+import time as clock
+from datetime import date, datetime, time, timedelta, timezone
+from rollups import SAME_DAY_ORDER
+
+MAX_PRODUCTION_DAYS = 366
+CACHE_TTL_SECONDS = float(os.getenv("PRODUCTION_CACHE_TTL", "300"))
+
+def production_pipeline(start: date, end: date):
+    start_dt = datetime.combine(start, time(), tzinfo=timezone.utc)
+    end_dt = datetime.combine(end, time(23, 59, 59), tzinfo=timezone.utc)
+    return [
+        {"$group": {"_id": "defaults", "morning": {"$sum": "$default_milk_morning"}, "evening": {"$sum": "$default_milk_evening"}}},
+        {"$unionWith": {"coll": "daily_variations", "pipeline": [
+            {"$match": {"date": {"$gte": start_dt, "$lte": end_dt}}},
+            # One variation per customer per day, the last in SAME_DAY_ORDER, as in the bills
+            {"$sort": dict(SAME_DAY_ORDER)},
+            {"$group": {"_id": {"customer_id": "$customer_id", "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}},
+                        "morning": {"$last": "$morning_quantity"}, "evening": {"$last": "$evening_quantity"}}},
+            {"$lookup": {"from": "customers", "let": {"oid": {"$convert": {"input": "$_id.customer_id", "to": "objectId", "onError": None, "onNull": None}}},
+                         "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", "$$oid"]}}}, {"$project": {"default_milk_morning": 1, "default_milk_evening": 1}}],
+                         "as": "customer"}},
+            {"$unwind": "$customer"},
+            {"$group": {"_id": "$_id.day",
+                        "morning": {"$sum": {"$subtract": ["$morning", "$customer.default_milk_morning"]}},
+                        "evening": {"$sum": {"$subtract": ["$evening", "$customer.default_milk_evening"]}},
+                        "variations": {"$sum": 1}}},
+        ]}},
+    ]
+
+def day_result(day: date, defaults, delta):
+    morning = defaults["morning"] + delta.get("morning", 0.0)
+    evening = defaults["evening"] + delta.get("evening", 0.0)
+    return {"date": day.isoformat(), "morning_liters": round(morning, 2), "evening_liters": round(evening, 2), "total_liters": round(morning + evening, 2), "variations": delta.get("variations", 0)}
+
+class ProductionCache:
+    def __init__(self):
+        self.days = {}
+        # Bumped by every invalidation; a result computed under an older generation may predate a write
+        self.generation = 0
+
+    def get(self, day: date):
+        entry = self.days.get(day)
+        if entry and entry[0] > clock.monotonic():
+            return entry[1]
+        return None
+
+    def put(self, day: date, result, generation: int):
+        """Stores result unless the cache was invalidated since generation was read."""
+        if generation == self.generation:
+            self.days[day] = (clock.monotonic() + CACHE_TTL_SECONDS, result)
+
+    def invalidate(self, days=None):
+        """Drops the given dates, or everything when days is None."""
+        self.generation += 1
+        if days is None:
+            self.days.clear()
+            return
+        for day in days:
+            self.days.pop(day, None)
+
+cache = ProductionCache()
+
+async def get_production(db, start: date, end: date):
+    """Per-day production for [start, end], aggregating only the dates not already cached."""
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    results = {day: cache.get(day) for day in days}
+    missing = [day for day, result in results.items() if result is None]
+    if missing:
+        # Read before the aggregate: a write that lands while it runs must not be cached over
+        generation = cache.generation
+        cursor = await db.customers.aggregate(production_pipeline(missing[0], missing[-1]), allowDiskUse=True)
+        defaults, deltas = {"morning": 0.0, "evening": 0.0}, {}
+        async for row in cursor:
+            if row["_id"] == "defaults":
+                defaults = row
+            else:
+                deltas[row["_id"]] = row
+        for day in missing:
+            results[day] = day_result(day, defaults, deltas.get(day.isoformat(), {}))
+            cache.put(day, results[day], generation)
+    return [results[day] for day in days]
@@ -0,0 +1,242 @@
+"""Per-customer monthly rollups of daily_variations.
+
+Each document in monthly_rollups holds the full-month totals for one customer,
+so bills can be answered with a single point lookup instead of a day loop:
+
+    {"_id": "<customer_id>:<year>:<month>", "customer_id", "year", "month", "num_days",
+     "customer_name", "price_per_liter", "total_morning", "total_evening",
+     "variation_count", "skip_count", "extra_count", "extra_liters", "less_count", "less_liters"}
+
+The extra/less fields compare each varied day's total with the customer's daily
+default: a day above it adds to extra_*, a day below it that is not a skip adds
+to less_*. A month with no variations has no rollup; its totals are just the defaults.
+Run `python rollups.py rebuild` to regenerate everything from daily_variations
+and `python rollups.py check` to compare the stored rollups against it.
+
+Rollups written before the extra/less fields existed are recomputed by
+`python rollups.py backfill`, a one-off migration to run once after deploying.
+Until then incremental writes leave those fields null rather than start them
+from zero, so the backfill can still find them.
+"""
+import asyncio
+import calendar
+import sys
+from bson import ObjectId
+from pymongo import UpdateOne
+
+ROLLUPS_COLLECTION = "monthly_rollups"
+# When a day has several variation rows (older ones stored the time of day), the latest counts.
+# (customer_id, date) is unique, so date alone decides, and the (customer_id, date) index serves the sort.
+SAME_DAY_ORDER = [("date", 1)]
+
+def rollup_id(customer_id: str, year: int, month: int):
+    return f"{customer_id}:{year}:{month}"
+
+def is_skip(variation):
+    return variation["morning_quantity"] + variation["evening_quantity"] == 0
+
+STAT_FIELDS = ["extra_count", "extra_liters", "less_count", "less_liters"]
+
+def default_totals(customer, num_days: int):
+    return {"total_morning": customer["default_milk_morning"] * num_days, "total_evening": customer["default_milk_evening"] * num_days,
+            "variation_count": 0, "skip_count": 0, **dict.fromkeys(STAT_FIELDS, 0)}
+
+def day_stats(customer, variation):
+    """One variation's contribution to the extra/less fields."""
+    total = variation["morning_quantity"] + variation["evening_quantity"]
+    default = customer["default_milk_morning"] + customer["default_milk_evening"]
+    extra = total > default
+    less = 0 < total < default
+    return {"extra_count": int(extra), "extra_liters": total - default if extra else 0.0, "less_count": int(less), "less_liters": default - total if less else 0.0}
+
+async def get_month_totals(db, customer_id: str, month: int, year: int):
+    """Full-month totals for a customer, or None if the customer does not exist."""
+    rollup = await db[ROLLUPS_COLLECTION].find_one({"_id": rollup_id(customer_id, year, month)})
+    if rollup:
+        return rollup
+    customer = await db.customers.find_one({"_id": ObjectId(customer_id)})
+    if not customer:
+        return None
+    num_days = calendar.monthrange(year, month)[1]
+    return {"customer_id": customer_id, "year": year, "month": month, "num_days": num_days, "customer_name": customer["name"], "price_per_liter": customer["price_per_liter"], **default_totals(customer, num_days)}
+
+async def apply_variation_changes(db, changes):
+    """Applies (previous_variation_or_None, new_variation) pairs to the rollups.
+
+    Deltas are summed per customer-month and written with one bulk_write; the
+    update pipeline seeds a missing rollup from the customer's defaults.
+    """
+    grouped = {}
+    for previous, new in changes:
+        grouped.setdefault((new["customer_id"], new["date"].year, new["date"].month), []).append((previous, new))
+    if not grouped:
+        return
+
+    customer_ids = {customer_id for customer_id, _, _ in grouped if ObjectId.is_valid(customer_id)}
+    customers = {str(c["_id"]): c async for c in db.customers.find({"_id": {"$in": [ObjectId(c) for c in customer_ids]}})}
+    operations = []
+    for (customer_id, year, month), pairs in grouped.items():
+        customer = customers.get(customer_id)
+        if customer is None:
+            continue
+        delta = {"morning": 0.0, "evening": 0.0, "variations": 0, "skips": 0, **dict.fromkeys(STAT_FIELDS, 0)}
+        for previous, new in pairs:
+            delta["morning"] += new["morning_quantity"]
+            delta["evening"] += new["evening_quantity"]
+            delta["skips"] += is_skip(new)
+            for field, value in day_stats(customer, new).items():
+                delta[field] += value
+            if previous is None:
+                # The day was on defaults until now; those are subtracted below
+                delta["variations"] += 1
+            else:
+                delta["morning"] -= previous["morning_quantity"]
+                delta["evening"] -= previous["evening_quantity"]
+                delta["skips"] -= is_skip(previous)
+                for field, value in day_stats(customer, previous).items():
+                    delta[field] -= value
+        num_days = calendar.monthrange(year, month)[1]
+        base = default_totals(customer, num_days)
+        morning = delta["morning"] - delta["variations"] * customer["default_milk_morning"]
+        evening = delta["evening"] - delta["variations"] * customer["default_milk_evening"]
+        operations.append(UpdateOne({"_id": rollup_id(customer_id, year, month)}, [{"$set": {
+            "customer_id": customer_id, "year": year, "month": month, "num_days": num_days,
+            "customer_name": customer["name"], "price_per_liter": customer["price_per_liter"],
+            "total_morning": {"$add": [{"$ifNull": ["$total_morning", base["total_morning"]]}, morning]},
+            "total_evening": {"$add": [{"$ifNull": ["$total_evening", base["total_evening"]]}, evening]},
+            "variation_count": {"$add": [{"$ifNull": ["$variation_count", 0]}, delta["variations"]]},
+            "skip_count": {"$add": [{"$ifNull": ["$skip_count", 0]}, delta["skips"]]},
+            # A new rollup starts from zero; an old one missing the field keeps it null for backfill_stats
+            **{field: {"$cond": [{"$eq": [{"$type": "$total_morning"}, "missing"]}, delta[field], {"$add": [f"${field}", delta[field]]}]} for field in STAT_FIELDS},
+        }}], upsert=True))
+    if operations:
+        await db[ROLLUPS_COLLECTION].bulk_write(operations, ordered=False)
+
+async def apply_customer_change(db, previous, updated):
+    """Propagates default, price and name changes of one customer to all their rollups.
+
+    The extra/less fields are measured against the defaults, so a default change
+    recomputes them from the customer's variations.
+    """
+    morning_delta = updated["default_milk_morning"] - previous["default_milk_morning"]
+    evening_delta = updated["default_milk_evening"] - previous["default_milk_evening"]
+    default_days = {"$subtract": ["$num_days", "$variation_count"]}
+    await db[ROLLUPS_COLLECTION].update_many({"customer_id": str(updated["_id"])}, [{"$set": {
+        "customer_name": updated["name"],
+        "price_per_liter": updated["price_per_liter"],
+        "total_morning": {"$add": ["$total_morning", {"$multiply": [morning_delta, default_days]}]},
+        "total_evening": {"$add": ["$total_evening", {"$multiply": [evening_delta, default_days]}]},
+    }}])
+    if morning_delta or evening_delta:
+        await rebuild_rollups(db, customer_id=str(updated["_id"]))
+
+def rollup_pipeline(customer_id: str | None = None):
+    """Recomputes the rollups from daily_variations, one output document per customer-month."""
+    first_of_month = {"$dateFromParts": {"year": "$_id.year", "month": "$_id.month"}}
+    default_days = {"$subtract": ["$num_days", "$variation_count"]}
+    default_total = {"$add": ["$customer.default_milk_morning", "$customer.default_milk_evening"]}
+    return [
+        *([{"$match": {"customer_id": customer_id}}] if customer_id is not None else []),
+        # One variation per calendar day, matching get_data_for_month
+        {"$sort": dict(SAME_DAY_ORDER)},
+        {"$group": {"_id": {"customer_id": "$customer_id", "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}},
+                    "date": {"$last": "$date"}, "morning": {"$last": "$morning_quantity"}, "evening": {"$last": "$evening_quantity"}}},
+        {"$group": {"_id": {"customer_id": "$_id.customer_id", "year": {"$year": "$date"}, "month": {"$month": "$date"}},
+                    "morning": {"$sum": "$morning"}, "evening": {"$sum": "$evening"}, "variation_count": {"$sum": 1},
+                    "skip_count": {"$sum": {"$cond": [{"$eq": [{"$add": ["$morning", "$evening"]}, 0]}, 1, 0]}},
+                    "day_totals": {"$push": {"$add": ["$morning", "$evening"]}}}},
+        {"$lookup": {"from": "customers", "let": {"oid": {"$convert": {"input": "$_id.customer_id", "to": "objectId", "onError": None, "onNull": None}}},
+                     "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", "$$oid"]}}}], "as": "customer"}},
+        {"$unwind": "$customer"},
+        {"$set": {"num_days": {"$dateDiff": {"startDate": first_of_month, "endDate": {"$dateAdd": {"startDate": first_of_month, "unit": "month", "amount": 1}}, "unit": "day"}}}},
+        {"$project": {
+            "_id": {"$concat": ["$_id.customer_id", ":", {"$toString": "$_id.year"}, ":", {"$toString": "$_id.month"}]},
+            "customer_id": "$_id.customer_id", "year": "$_id.year", "month": "$_id.month", "num_days": 1,
+            "customer_name": "$customer.name", "price_per_liter": "$customer.price_per_liter",
+            "total_morning": {"$add": ["$morning", {"$multiply": [default_days, "$customer.default_milk_morning"]}]},
+            "total_evening": {"$add": ["$evening", {"$multiply": [default_days, "$customer.default_milk_evening"]}]},
+            "variation_count": 1, "skip_count": 1,
+            "extra_count": {"$size": {"$filter": {"input": "$day_totals", "cond": {"$gt": ["$$this", default_total]}}}},
+            "extra_liters": {"$sum": {"$map": {"input": "$day_totals", "in": {"$max": [0, {"$subtract": ["$$this", default_total]}]}}}},
+            "less_count": {"$size": {"$filter": {"input": "$day_totals", "cond": {"$and": [{"$gt": ["$$this", 0]}, {"$lt": ["$$this", default_total]}]}}}},
+            "less_liters": {"$sum": {"$map": {"input": "$day_totals", "in": {"$cond": [{"$and": [{"$gt": ["$$this", 0]}, {"$lt": ["$$this", default_total]}]}, {"$subtract": [default_total, "$$this"]}, 0]}}}},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+
+async def rebuild_rollups(db, customer_id: str | None = None):
+    """Atomically replaces monthly_rollups with a fresh computation ($out keeps the indexes).
+
+    With a customer_id, only that customer's rollups are recomputed and merged in.
+    """
+    if customer_id is not None:
+        merge = {"$merge": {"into": ROLLUPS_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+        cursor = await db.daily_variations.aggregate(rollup_pipeline(customer_id) + [merge])
+        await cursor.to_list(None)
+        return await db[ROLLUPS_COLLECTION].count_documents({"customer_id": customer_id})
+    cursor = await db.daily_variations.aggregate(rollup_pipeline() + [{"$out": ROLLUPS_COLLECTION}], allowDiskUse=True)
+    await cursor.to_list(None)
+    return await db[ROLLUPS_COLLECTION].estimated_document_count()
+
+async def backfill_stats(db):
+    """Recomputes every customer that has a rollup without the extra/less fields; returns how many."""
+    # {field: None} matches both a missing and a null field
+    customer_ids = await db[ROLLUPS_COLLECTION].distinct("customer_id", {"$or": [{field: None} for field in STAT_FIELDS]})
+    for customer_id in customer_ids:
+        await rebuild_rollups(db, customer_id=customer_id)
+    return len(customer_ids)
+
+async def check_rollups(db, tolerance: float = 1e-6):
+    """Merge-joins the stored rollups with a recomputation; returns a list of problems."""
+    fields = ["customer_name", "price_per_liter", "total_morning", "total_evening", "variation_count", "skip_count", *STAT_FIELDS]
+    expected = await db.daily_variations.aggregate(rollup_pipeline(), allowDiskUse=True)
+    stored = db[ROLLUPS_COLLECTION].find().sort("_id", 1)
+    problems = []
+    want, have = await anext(expected, None), await anext(stored, None)
+    while want is not None or have is not None:
+        if have is None or (want is not None and want["_id"] < have["_id"]):
+            problems.append(f"{want['_id']}: missing rollup")
+            want = await anext(expected, None)
+        elif want is None or have["_id"] < want["_id"]:
+            problems.append(f"{have['_id']}: rollup has no variations behind it")
+            have = await anext(stored, None)
+        else:
+            for field in fields:
+                expected_value, stored_value = want[field], have.get(field)
+                if isinstance(expected_value, str) or stored_value is None:
+                    mismatch = expected_value != stored_value
+                else:
+                    mismatch = abs(expected_value - stored_value) > tolerance
+                if mismatch:
+                    problems.append(f"{want['_id']}: {field} is {stored_value}, expected {expected_value}")
+            want, have = await anext(expected, None), await anext(stored, None)
+    return problems
+
+
+async def run(command):
+    from main import create_client
+
+    client = create_client()
+    db = client.dairy_project
+    try:
+        if command == "rebuild":
+            print(f"Rebuilt {await rebuild_rollups(db)} monthly rollups.")
+            return 0
+        if command == "backfill":
+            print(f"Recomputed the rollups of {await backfill_stats(db)} customers.")
+            return 0
+        problems = await check_rollups(db)
+        for problem in problems:
+            print(problem)
+        print(f"{len(problems)} inconsistencies found.")
+        return 1 if problems else 0
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command not in ("rebuild", "backfill", "check"):
+        print("Usage: python rollups.py [rebuild|backfill|check]")
+        sys.exit(2)
+    sys.exit(asyncio.run(run(command)))
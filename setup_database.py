@@ -1,35 +1,137 @@
+import asyncio
+import inspect
+import sys
+from datetime import datetime, timezone
 import pymongo
-from pymongo.errors import ConnectionFailure
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure, OperationFailure
 import os
 from dotenv import load_dotenv
 
+DB_NAME = "dairy_project"
+CUSTOMERS_COLLECTION = "customers"
+VARIATIONS_COLLECTION = "daily_variations"
+ROLLUPS_COLLECTION = "monthly_rollups"
+INVOICES_COLLECTION = "invoices"
+
+# (collection, keys, options). create_index is a no-op when an identical index exists,
+# so this list can be applied on every startup. Customers need no secondary index:
+# every customer read goes by _id or scans the collection in _id order.
+INDEXES = [
+    (VARIATIONS_COLLECTION, [("customer_id", pymongo.ASCENDING), ("date", pymongo.ASCENDING)], {"name": "customer_date_unique", "unique": True}),
+    (VARIATIONS_COLLECTION, [("date", pymongo.ASCENDING)], {"name": "date"}),
+    # Rollups are point-read by _id; this one serves customer default changes
+    (ROLLUPS_COLLECTION, [("customer_id", pymongo.ASCENDING)], {"name": "customer_id"}),
+    # Fleet analytics read one month of rollups at a time
+    (ROLLUPS_COLLECTION, [("year", pymongo.ASCENDING), ("month", pymongo.ASCENDING)], {"name": "year_month"}),
+    (INVOICES_COLLECTION, [("customer_id", pymongo.ASCENDING), ("year", pymongo.ASCENDING), ("month", pymongo.ASCENDING), ("version", pymongo.ASCENDING)], {"name": "customer_month_version_unique", "unique": True}),
+]
+
+# The export merge-joins variations in (customer_id, date) order, so it is pinned to that index
+EXPORT_HINT = [("customer_id", pymongo.ASCENDING), ("date", pymongo.ASCENDING)]
+
+def hot_queries():
+    """The queries the API runs on every request, as (label, collection, filter, sort, hint).
+
+    A query with a hint is pinned to an index so it can stream in index order; it
+    must not need an in-memory SORT.
+    """
+    start = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    end = datetime(2000, 1, 31, 23, 59, 59, tzinfo=timezone.utc)
+    return [
+        ("monthly variations (get_data_for_month)", VARIATIONS_COLLECTION, {"customer_id": "000000000000000000000000", "date": {"$gte": start, "$lte": end}}, [("date", pymongo.ASCENDING)], None),
+        ("variation upsert (add_variation)", VARIATIONS_COLLECTION, {"customer_id": "000000000000000000000000", "date": start}, None, None),
+        ("variations by date range (production)", VARIATIONS_COLLECTION, {"date": {"$gte": start, "$lte": end}}, [("date", pymongo.ASCENDING)], None),
+        ("sheet export (export.iter_sheet_rows)", VARIATIONS_COLLECTION, {"date": {"$gte": start, "$lte": end}}, EXPORT_HINT, EXPORT_HINT),
+        ("fleet month rollups (analytics)", ROLLUPS_COLLECTION, {"year": 2000, "month": 1, "skip_count": {"$gt": 0}}, [("skip_count", pymongo.DESCENDING)], None),
+        # Also the inner query of the invoices $lookup in the /bills pipeline
+        ("closed month lookup (latest_invoice, /bills)", INVOICES_COLLECTION, {"customer_id": "000000000000000000000000", "year": 2000, "month": 1}, [("version", pymongo.DESCENDING)], None),
+    ]
+
+async def _create_indexes(db):
+    """Creates every index in INDEXES on a sync or async database. Safe to call repeatedly."""
+    created = []
+    for collection, keys, options in INDEXES:
+        try:
+            name = db[collection].create_index(keys, **options)
+            created.append(await name if inspect.isawaitable(name) else name)
+        except OperationFailure as e:
+            # Most likely duplicate (customer_id, date) rows written before the unique index existed
+            print(f"Warning: could not create index {options['name']} on '{collection}': {e}")
+    return created
+
+def ensure_indexes(db):
+    """Creates every index the API relies on, for a sync MongoClient database."""
+    return asyncio.run(_create_indexes(db))
+
+async def ensure_indexes_async(db):
+    """ensure_indexes for an AsyncMongoClient database, used by the API at startup."""
+    return await _create_indexes(db)
+
+def winning_stages(plan):
+    """Flattens a winningPlan tree into the list of its stage names."""
+    stages = [plan.get("stage")]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages.extend(winning_stages(child))
+    # Newer servers wrap the classic plan under queryPlan
+    if "queryPlan" in plan:
+        stages.extend(winning_stages(plan["queryPlan"]))
+    return [s for s in stages if s]
+
+def explain_hot_queries(db):
+    """Returns {label: [stages]} for the winning plan of each hot query."""
+    report = {}
+    for label, collection, query, sort, hint in hot_queries():
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if hint:
+            cursor = cursor.hint(hint)
+        report[label] = winning_stages(cursor.explain()["queryPlanner"]["winningPlan"])
+    return report
+
+def check_hot_queries(db):
+    """Returns the labels of hot queries that would scan the collection, or sort in memory despite a hint."""
+    hinted = {label for label, _, _, _, hint in hot_queries() if hint}
+    return [label for label, stages in explain_hot_queries(db).items()
+            if "COLLSCAN" in stages or "IXSCAN" not in stages or (label in hinted and "SORT" in stages)]
+
 def setup_db():
     """
-    Connects to MongoDB and ensures the database and collections exist.
+    Connects to MongoDB, ensures the collections and indexes exist and reports the query plans.
     """
     try:
-        # --- 1. Connect to the local MongoDB server ---
-        # Replace the local connection with your Atlas SRV string
-  
- 
-load_dotenv()
+        load_dotenv()
         MONGO_URI = os.getenv("MONGO_URI")
         client: MongoClient = MongoClient(MONGO_URI)
-        
+
         # The ismaster command is cheap and does not require auth.
         client.admin.command('ismaster')
         print("--- Successfully connected to MongoDB! ---")
 
     except ConnectionFailure as e:
         print(f"Error: Could not connect to MongoDB. {e}")
-        return
+        return False
 
-    # --- 2. Define names and get a handle for the database ---
-    DB_NAME = "dairy_project"
     db = client[DB_NAME]
 
-    CUSTOMERS_COLLECTION = "customers"
-    VARIATIONS_COLLECTION = "daily_variations"
+    # --- 1. Make sure the collections exist ---
+    existing = db.list_collection_names()
+    for name in (CUSTOMERS_COLLECTION, VARIATIONS_COLLECTION, ROLLUPS_COLLECTION, INVOICES_COLLECTION):
+        if name not in existing:
+            db.create_collection(name)
+
+    # --- 2. Create indexes ---
+    print(f"Indexes ensured: {ensure_indexes(db)}")
+
+    # --- 3. Report index usage for the hot queries ---
+    print("\nQuery plans:")
+    for label, stages in explain_hot_queries(db).items():
+        print(f"  {label}: {' <- '.join(stages)}")
+    failing = check_hot_queries(db)
+    if failing:
+        print(f"\nCollection scans or in-memory sorts detected: {failing}")
 
     # --- 4. Verify and print the final state ---
     print(f"\nFinal collections in '{DB_NAME}': {db.list_collection_names()}")
@@ -37,8 +139,12 @@ load_dotenv()
 
     # Close the connection
     client.close()
+    return not failing
 
 
 if __name__ == "__main__":
 
-    setup_db()
+    # --check exits non-zero if any hot query is not served by an index
+    ok = setup_db()
+    if "--check" in sys.argv and not ok:
+        sys.exit(1)
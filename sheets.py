@@ -0,0 +1,54 @@
+"""Monthly sheet and variation summary builders shared by the API and month-close."""
+import calendar
+from datetime import datetime, date, timezone
+
+SHEET_COLUMNS = ["Date", "Morning (L)", "Evening (L)", "Daily Total (L)"]
+
+def month_bounds(month: int, year: int):
+    start_date = datetime(year, month, 1, tzinfo=timezone.utc)
+    num_days = calendar.monthrange(year, month)[1]
+    end_date = datetime(year, month, num_days, 23, 59, 59, tzinfo=timezone.utc)
+    return start_date, end_date, num_days
+
+def build_monthly_sheet(customer, variations, num_days: int, month: int, year: int):
+    sheet_data = []
+    today = date.today()
+    days_to_show = num_days
+    if year == today.year and month == today.month:
+        days_to_show = today.day
+    total_morning, total_evening = 0.0, 0.0
+    for day_num in range(1, days_to_show + 1):
+        current_date_str = date(year, month, day_num).isoformat()
+        if current_date_str in variations:
+            morning_qty = variations[current_date_str]["morning_quantity"]
+            evening_qty = variations[current_date_str]["evening_quantity"]
+        else:
+            morning_qty = customer["default_milk_morning"]
+            evening_qty = customer["default_milk_evening"]
+        daily_total = morning_qty + evening_qty
+        total_morning += morning_qty
+        total_evening += evening_qty
+        sheet_data.append({"Date": current_date_str, "Morning (L)": morning_qty, "Evening (L)": evening_qty, "Daily Total (L)": daily_total})
+    grand_total = total_morning + total_evening
+    return {"sheet_data": sheet_data, "totals": {"total_morning": round(total_morning, 2), "total_evening": round(total_evening, 2), "grand_total_liters": round(grand_total, 2), "amount_due": round(grand_total * customer["price_per_liter"], 2)}}
+
+def build_variations_summary(customer, variations):
+    summary_data = []
+    for date_str, variation_data in variations.items():
+        summary_data.append({
+            "date": date_str,
+            "morning": variation_data["morning_quantity"],
+            "evening": variation_data["evening_quantity"],
+            "total": variation_data["morning_quantity"] + variation_data["evening_quantity"],
+            # Add the default values to the response
+            "default_morning": customer["default_milk_morning"],
+            "default_evening": customer["default_milk_evening"]
+        })
+        
+    summary_data.sort(key=lambda x: x['date'])
+    return summary_data
+
+def columnar_sheet(sheet):
+    """The sheet as one array per column, which is smaller and cheaper to serialize than a dict per day."""
+    rows = sheet["sheet_data"]
+    return {"columns": {column: [row[column] for row in rows] for column in SHEET_COLUMNS}, "totals": sheet["totals"]}
@@ -0,0 +1,86 @@
+"""Date-range statements computed with NumPy.
+
+All variations for the range (and for every requested customer) come from one
+query. Each customer's days become a row of a 2-D array pre-filled with their
+defaults, the variations are scattered in, and the per-month subtotals are
+summed along the row. Each month is totalled and rounded the way
+get_customer_bill does it: morning plus evening liters, then round to 2 places,
+and the amount from the unrounded liters.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from bson import ObjectId
+from rollups import SAME_DAY_ORDER
+
+MAX_STATEMENT_DAYS = 3 * 366
+# Bounds the customers x days arrays one request can allocate
+MAX_STATEMENT_CUSTOMERS = 500
+
+def month_segments(start: date, end: date):
+    """(year, month, first_offset, end_offset) for each month touched by [start, end]."""
+    segments = []
+    offset, current = 0, start
+    while current <= end:
+        next_month = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+        last = min(end, next_month - timedelta(days=1))
+        days = (last - current).days + 1
+        segments.append((current.year, current.month, offset, offset + days))
+        offset += days
+        current = next_month
+    return segments
+
+def segment_sums(values, first: int, last: int):
+    """Left-to-right sums of values[:, first:last] for every row of a 2-D NumPy array."""
+    return values[:, first:last].cumsum(axis=1)[:, -1]
+
+async def build_statements(db, customers, start: date, end: date):
+    """Statements for the given customer documents, in the same order."""
+    # Deferred so importing the app does not load NumPy; only statement requests need it
+    import numpy as np
+    if not customers:
+        return []
+    num_days = (end - start).days + 1
+    rows = {str(c["_id"]): i for i, c in enumerate(customers)}
+    morning = np.repeat(np.array([[c["default_milk_morning"]] for c in customers], dtype=float), num_days, axis=1)
+    evening = np.repeat(np.array([[c["default_milk_evening"]] for c in customers], dtype=float), num_days, axis=1)
+
+    start_dt = datetime.combine(start, time(), tzinfo=timezone.utc)
+    end_dt = datetime.combine(end, time(23, 59, 59), tzinfo=timezone.utc)
+    cursor = db.daily_variations.find({"customer_id": {"$in": list(rows)}, "date": {"$gte": start_dt, "$lte": end_dt}},
+                                      {"_id": 0, "customer_id": 1, "date": 1, "morning_quantity": 1, "evening_quantity": 1}).sort(SAME_DAY_ORDER)
+    row_index, day_index, morning_values, evening_values = [], [], [], []
+    async for v in cursor.batch_size(5000):
+        row_index.append(rows[v["customer_id"]])
+        day_index.append((v["date"].date() - start).days)
+        morning_values.append(v["morning_quantity"])
+        evening_values.append(v["evening_quantity"])
+    if row_index:
+        # Fancy assignment keeps the last value for repeated (row, day) pairs, like the dict in get_data_for_month
+        morning[row_index, day_index] = morning_values
+        evening[row_index, day_index] = evening_values
+
+    segments = month_segments(start, end)
+    month_totals = []
+    for year, month, first, last in segments:
+        m, e = segment_sums(morning, first, last), segment_sums(evening, first, last)
+        month_totals.append((year, month, last - first, m, e, m + e))
+    grand_morning, grand_evening = segment_sums(morning, 0, num_days), segment_sums(evening, 0, num_days)
+    grand_total = grand_morning + grand_evening
+
+    statements = []
+    for i, customer in enumerate(customers):
+        price = customer["price_per_liter"]
+        months = [{"year": year, "month": month, "days": days, "total_morning": round(float(m[i]), 2), "total_evening": round(float(e[i]), 2),
+                   "total_liters": round(float(t[i]), 2), "amount_due": round(float(t[i]) * price, 2)}
+                  for year, month, days, m, e, t in month_totals]
+        statements.append({
+            "customer_id": str(customer["_id"]), "customer_name": customer["name"], "price_per_liter": price,
+            "start": start.isoformat(), "end": end.isoformat(), "months": months,
+            "total_morning": round(float(grand_morning[i]), 2), "total_evening": round(float(grand_evening[i]), 2),
+            "total_liters": round(float(grand_total[i]), 2), "amount_due": round(float(grand_total[i]) * price, 2),
+        })
+    return statements
+
+async def fetch_customers(db, customer_ids):
+    """Customer documents for the ids, in request order; unknown ids are left out."""
+    found = {str(c["_id"]): c async for c in db.customers.find({"_id": {"$in": [ObjectId(c) for c in customer_ids]}})}
+    return [found[c] for c in customer_ids if c in found]
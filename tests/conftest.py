@@ -0,0 +1,55 @@
+"""Shared fixtures.
+
+Tests that need MongoDB connect to TEST_MONGO_URI (default mongodb://localhost:27017),
+never to the MONGO_URI the app reads from .env, and are skipped when nothing
+answers there. Each test gets its own throwaway database, dropped afterwards.
+"""
+import asyncio
+import os
+import uuid
+from contextlib import asynccontextmanager
+import httpx
+import pytest
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.errors import PyMongoError
+from setup_database import ensure_indexes_async
+
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017")
+
+@pytest.fixture(scope="session")
+def mongo_uri():
+    try:
+        with MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=1000) as client:
+            client.admin.command("ping")
+    except PyMongoError:
+        pytest.skip(f"MongoDB is not reachable at {TEST_MONGO_URI}")
+    return TEST_MONGO_URI
+
+@pytest.fixture
+def run_db(mongo_uri):
+    """run_db(test) awaits test(db) in a fresh event loop against a throwaway, indexed database."""
+    def run(test):
+        async def scoped():
+            client = AsyncMongoClient(mongo_uri)
+            db = client[f"dairy_test_{uuid.uuid4().hex[:12]}"]
+            try:
+                await ensure_indexes_async(db)
+                return await test(db)
+            finally:
+                await client.drop_database(db.name)
+                await client.close()
+        return asyncio.run(scoped())
+    return run
+
+@pytest.fixture
+def api():
+    """`async with api(db) as http:` calls the FastAPI app in-process with main.db set to db."""
+    import main
+
+    @asynccontextmanager
+    async def connect(db):
+        main.client, main.db = db.client, db
+        main.production.cache.invalidate()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as http:
+            yield http
+    return connect
@@ -0,0 +1,19 @@
+from datetime import datetime
+from benchmarks import datagen
+
+START = datetime(2025, 1, 1)
+
+def test_bills_match_each_customer_bill(run_db, api):
+    async def test(db):
+        customers, _ = await datagen.load(db, 25, 60, START, seed=7)
+        async with api(db) as http:
+            # A late write on top of the generated data moves one rollup incrementally
+            customer_id = str(customers[0]["_id"])
+            (await http.post("/variations", json={"customer_id": customer_id, "date": "2025-01-05T00:00:00", "morning_quantity": 3.3, "evening_quantity": 0.1})).raise_for_status()
+            for month in (1, 2, 3):
+                bills = (await http.get("/bills", params={"month": month, "year": 2025})).json()
+                assert len(bills) == len(customers)
+                for bill in bills:
+                    single = (await http.get(f"/customers/{bill['customer_id']}/bill", params={"month": month, "year": 2025})).json()
+                    assert (bill["customer_name"], bill["total_liters"], bill["amount_due"]) == (single["customer_name"], single["total_liters"], single["amount_due"])
+    run_db(test)
@@ -0,0 +1,23 @@
+from datetime import date, datetime
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+from main import MAX_BULK_DAYS, MAX_BULK_VARIATIONS, BulkVariations
+
+CUSTOMER_ID = "0" * 24
+
+def test_range_expands_to_one_variation_per_day():
+    variations = BulkVariations(customer_id=CUSTOMER_ID, start_date=date(2025, 1, 30), end_date=date(2025, 2, 2), morning_quantity=1.0).expand()
+    assert [v.date.date() for v in variations] == [date(2025, 1, 30), date(2025, 1, 31), date(2025, 2, 1), date(2025, 2, 2)]
+
+def test_range_longer_than_the_cap_is_rejected():
+    bulk = BulkVariations(customer_id=CUSTOMER_ID, start_date=date(2024, 1, 1), end_date=date(2024, 1, 1).replace(year=2025))
+    assert (bulk.end_date - bulk.start_date).days + 1 > MAX_BULK_DAYS
+    with pytest.raises(HTTPException) as e:
+        bulk.expand()
+    assert e.value.status_code == 422
+
+def test_variation_list_longer_than_the_cap_is_rejected():
+    item = {"customer_id": CUSTOMER_ID, "date": datetime(2025, 1, 1), "morning_quantity": 1.0, "evening_quantity": 0.0}
+    with pytest.raises(ValidationError):
+        BulkVariations(variations=[item] * (MAX_BULK_VARIATIONS + 1))
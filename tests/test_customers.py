@@ -0,0 +1,10 @@
+CUSTOMER = {"name": "Ram Kumar", "address": "House 1", "phone_number": "9000000000", "default_milk_morning": 1.0, "default_milk_evening": 0.5, "price_per_liter": 60.0}
+
+def test_get_customer_same_body_with_and_without_fast(run_db, api):
+    async def test(db):
+        async with api(db) as http:
+            created = (await http.post("/customers", json=CUSTOMER)).json()
+            slow = (await http.get(f"/customers/{created['_id']}")).json()
+            fast = (await http.get(f"/customers/{created['_id']}", params={"fast": True})).json()
+            assert slow == fast == created
+    run_db(test)
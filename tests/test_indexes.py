@@ -0,0 +1,29 @@
+import uuid
+from datetime import datetime
+import pytest
+from pymongo import MongoClient
+from setup_database import CUSTOMERS_COLLECTION, INVOICES_COLLECTION, VARIATIONS_COLLECTION, check_hot_queries, ensure_indexes, explain_hot_queries
+
+@pytest.fixture
+def sync_db(mongo_uri):
+    client = MongoClient(mongo_uri)
+    db = client[f"dairy_test_{uuid.uuid4().hex[:12]}"]
+    yield db
+    client.drop_database(db.name)
+    client.close()
+
+def test_hot_queries_use_an_index(sync_db):
+    ensure_indexes(sync_db)
+    sync_db[CUSTOMERS_COLLECTION].insert_many([{"name": f"Customer {i}"} for i in range(50)])
+    sync_db[VARIATIONS_COLLECTION].insert_many([{"customer_id": f"{i:024x}", "date": datetime(2000, 1, 1 + i % 28), "morning_quantity": 1.0, "evening_quantity": 0.0} for i in range(50)])
+    sync_db[INVOICES_COLLECTION].insert_many([{"customer_id": f"{i:024x}", "year": 2000, "month": 1, "version": 1} for i in range(50)])
+    assert check_hot_queries(sync_db) == [], explain_hot_queries(sync_db)
+
+def test_ensure_indexes_is_idempotent(sync_db):
+    assert ensure_indexes(sync_db) == ensure_indexes(sync_db)
+
+def test_export_streams_in_index_order(sync_db):
+    ensure_indexes(sync_db)
+    sync_db[VARIATIONS_COLLECTION].insert_many([{"customer_id": f"{i % 7:024x}", "date": datetime(2000, 1, 1 + i % 28), "morning_quantity": 1.0, "evening_quantity": 0.0} for i in range(196)])
+    stages = explain_hot_queries(sync_db)["sheet export (export.iter_sheet_rows)"]
+    assert "SORT" not in stages and "IXSCAN" in stages, stages
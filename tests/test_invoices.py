@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime
+import pytest
+from bson import ObjectId
+from benchmarks import datagen
+import invoices
+
+START = datetime(2025, 1, 1)
+PARAMS = {"month": 1, "year": 2025}
+
+async def closed_month(db, http):
+    customers, _ = await datagen.load(db, 5, 60, START, seed=11)
+    (await http.post("/invoices/close", params=PARAMS)).raise_for_status()
+    return str(customers[0]["_id"])
+
+async def assert_reads_match_invoice(http, customer_id):
+    invoice = (await http.get(f"/customers/{customer_id}/invoice", params=PARAMS)).json()
+    expected = (invoice["totals"]["grand_total_liters"], invoice["totals"]["amount_due"])
+    bill = (await http.get(f"/customers/{customer_id}/bill", params=PARAMS)).json()
+    totals = (await http.get(f"/customers/{customer_id}/totals", params=PARAMS)).json()
+    row = next(b for b in (await http.get("/bills", params=PARAMS)).json() if b["customer_id"] == customer_id)
+    assert (bill["total_liters"], bill["amount_due"]) == expected
+    assert (totals["grand_total_liters"], totals["amount_due"]) == expected
+    assert (row["total_liters"], row["amount_due"]) == expected
+    return invoice
+
+LATE_EDIT = {"customer_id": None, "date": "2025-01-05T00:00:00", "morning_quantity": 7.0, "evening_quantity": 0.0}
+
+def test_late_edit_rejected(run_db, api, monkeypatch):
+    monkeypatch.setattr(invoices, "LATE_EDIT_POLICY", "reject")
+    async def test(db):
+        async with api(db) as http:
+            customer_id = await closed_month(db, http)
+            before = await assert_reads_match_invoice(http, customer_id)
+            response = await http.post("/variations", json={**LATE_EDIT, "customer_id": customer_id})
+            assert response.status_code == 409
+            bulk = (await http.post("/variations/bulk", json={"variations": [{**LATE_EDIT, "customer_id": customer_id}]})).json()
+            assert bulk["failed"] == 1
+            # A price change after the close moves the rollups but not what was invoiced
+            (await http.patch(f"/customers/{customer_id}", json={"price_per_liter": 99.0})).raise_for_status()
+            after = await assert_reads_match_invoice(http, customer_id)
+            assert after["version"] == 1 and after["content_hash"] == before["content_hash"]
+    run_db(test)
+
+def test_late_edit_revises_invoice(run_db, api, monkeypatch):
+    monkeypatch.setattr(invoices, "LATE_EDIT_POLICY", "revise")
+    async def test(db):
+        async with api(db) as http:
+            customer_id = await closed_month(db, http)
+            (await http.post("/variations", json={**LATE_EDIT, "customer_id": customer_id})).raise_for_status()
+            invoice = await assert_reads_match_invoice(http, customer_id)
+            assert invoice["version"] == 2
+            assert {"date": "2025-01-05", "morning": 7.0} in [{"date": v["date"], "morning": v["morning"]} for v in invoice["variations_summary"]]
+            # Resending the same edit stores nothing new
+            (await http.post("/variations", json={**LATE_EDIT, "customer_id": customer_id})).raise_for_status()
+            assert (await assert_reads_match_invoice(http, customer_id))["version"] == 2
+    run_db(test)
+
+def test_concurrent_revisions_share_one_version(run_db, api):
+    async def test(db):
+        async with api(db) as http:
+            customer_id = await closed_month(db, http)
+        customer = await db.customers.find_one({"_id": ObjectId(customer_id)})
+        await db.daily_variations.insert_one({"customer_id": customer_id, "date": datetime(2025, 1, 6), "morning_quantity": 9.0, "evening_quantity": 0.0})
+        revised = await asyncio.gather(*[invoices.revise_invoice(db, customer, 1, 2025) for _ in range(4)])
+        assert {invoice["version"] for invoice in revised} == {2}
+        assert await db[invoices.INVOICES_COLLECTION].count_documents({"customer_id": customer_id, "year": 2025, "month": 1}) == 2
+    run_db(test)
+
+def test_current_month_skips_invoice_lookup(monkeypatch):
+    import main
+    async def fail(*args, **kwargs):
+        pytest.fail("latest_invoice queried for a month that cannot be closed")
+    monkeypatch.setattr(invoices, "latest_invoice", fail)
+    today = datetime.now()
+    assert asyncio.run(main.closed_invoice("0" * 24, today.month, today.year)) is None
+
+@pytest.mark.parametrize("batch_size, concurrency", [(0, 4), (500, 0), (-1, 1)])
+def test_close_month_rejects_non_positive_sizes(batch_size, concurrency):
+    with pytest.raises(ValueError):
+        asyncio.run(asyncio.wait_for(invoices.close_month(None, 1, 2025, batch_size, concurrency), 5))
@@ -0,0 +1,27 @@
+import asyncio
+import httpx
+from benchmarks import loadtest
+
+IDS = [f"{i:024x}" for i in range(5)]
+
+def listing(request):
+    # Pages by after/limit like the current API
+    after, limit = request.url.params.get("after"), int(request.url.params.get("limit", 1000))
+    remaining = [i for i in IDS if after is None or i > after]
+    return httpx.Response(200, json=[{"_id": i} for i in remaining[:limit]])
+
+def unpaged_listing(request):
+    # The sync build returns every customer whatever the params
+    return httpx.Response(200, json=[{"_id": i} for i in IDS])
+
+def collect(handler):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://test") as http:
+            return await loadtest.remote_customer_ids(http)
+    return asyncio.run(asyncio.wait_for(run(), 5))
+
+def test_remote_customer_ids_pages_through_the_listing():
+    assert collect(listing) == IDS
+
+def test_remote_customer_ids_stops_when_a_page_repeats():
+    assert collect(unpaged_listing) == IDS
@@ -0,0 +1,24 @@
+from name_index import NameIndex, tokenize
+
+CUSTOMERS = [
+    {"_id": 1, "name": "Ram"},
+    {"_id": 2, "name": "Ram Kumar"},
+    {"_id": 3, "name": "राम शर्मा"},
+    {"_id": 4, "name": "José Núñez"},
+]
+
+def test_tokenize_keeps_non_ascii_words_whole():
+    assert tokenize("राम शर्मा को 2 लीटर") == ["राम", "शर्मा", "को", "2", "लीटर"]
+    assert tokenize("JOSÉ, núñez!") == ["josé", "núñez"]
+
+def test_longest_name_wins():
+    index = NameIndex(CUSTOMERS)
+    assert index.find("2 liters extra for ram kumar")["_id"] == 2
+    assert index.find("ramesh wants milk") is None
+
+def test_non_ascii_names_match():
+    index = NameIndex(CUSTOMERS)
+    assert index.find("राम शर्मा को आज दूध नहीं")["_id"] == 3
+    assert [c["_id"] for c in index.find_all("bill for José Núñez and Ram")] == [4, 1]
+    # Decomposed accents (as some keyboards send them) match the composed name
+    assert index.find("José Núñez")["_id"] == 4
@@ -0,0 +1,17 @@
+from datetime import date
+from production import ProductionCache
+
+DAY = date(2025, 1, 5)
+
+def test_put_after_invalidation_is_dropped():
+    cache = ProductionCache()
+    generation = cache.generation
+    # A write lands while the aggregate for DAY is still running
+    cache.invalidate([DAY])
+    cache.put(DAY, {"total_liters": 1.0}, generation)
+    assert cache.get(DAY) is None
+
+def test_put_without_invalidation_is_kept():
+    cache = ProductionCache()
+    cache.put(DAY, {"total_liters": 1.0}, cache.generation)
+    assert cache.get(DAY) == {"total_liters": 1.0}
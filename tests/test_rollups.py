@@ -0,0 +1,55 @@
+from datetime import datetime
+from benchmarks import datagen
+from main import Variation
+import analytics
+import rollups
+
+START = datetime(2025, 1, 1)
+
+def test_variation_dates_are_stored_at_midnight_utc():
+    variation = Variation(customer_id="0" * 24, date="2025-01-05T02:30:00+05:30", morning_quantity=1.0, evening_quantity=0.0)
+    assert variation.date == datetime(2025, 1, 4)
+    assert Variation(customer_id="0" * 24, date="2025-01-05T18:45:10", morning_quantity=1.0, evening_quantity=0.0).date == datetime(2025, 1, 5)
+
+def test_rollups_match_a_full_rebuild_after_mixed_writes(run_db, api):
+    async def test(db):
+        customers, _ = await datagen.load(db, 10, 60, START, seed=3)
+        first, second = str(customers[0]["_id"]), str(customers[1]["_id"])
+        async with api(db) as http:
+            # The same day sent at different times of day, and then again through bulk
+            for when in ("2025-01-05T00:00:00", "2025-01-05T10:30:00", "2025-01-05T18:00:00+00:00"):
+                (await http.post("/variations", json={"customer_id": first, "date": when, "morning_quantity": 2.5, "evening_quantity": 0.5})).raise_for_status()
+            bulk = [{"customer_id": first, "date": "2025-01-05T09:00:00", "morning_quantity": 0.0, "evening_quantity": 0.0},
+                    {"customer_id": second, "date": "2025-01-31T23:59:00", "morning_quantity": 4.0, "evening_quantity": 1.0},
+                    {"customer_id": second, "date": "2025-02-01T06:00:00", "morning_quantity": 0.5, "evening_quantity": 0.5}]
+            (await http.post("/variations/bulk", json={"variations": bulk})).raise_for_status()
+            (await http.post("/variations/bulk", json={"customer_id": second, "start_date": "2025-01-30", "end_date": "2025-02-03", "morning_quantity": 1.0, "evening_quantity": 2.0})).raise_for_status()
+            (await http.patch(f"/customers/{first}", json={"default_milk_morning": 1.75})).raise_for_status()
+            (await http.post("/variations", json={"customer_id": first, "date": "2025-02-10T12:00:00", "morning_quantity": 1.0, "evening_quantity": 1.0})).raise_for_status()
+        assert await db.daily_variations.count_documents({"customer_id": first, "date": {"$gte": datetime(2025, 1, 5), "$lt": datetime(2025, 1, 6)}}) == 1
+        assert await rollups.check_rollups(db) == []
+    run_db(test)
+
+def test_backfill_fills_rollups_that_predate_the_stat_fields(run_db, api):
+    async def test(db):
+        customers, _ = await datagen.load(db, 10, 60, START, seed=5)
+        expected = await analytics.top_customers(db, 1, 2025, "extra_liters", 10)
+        await db[rollups.ROLLUPS_COLLECTION].update_many({}, {"$unset": dict.fromkeys(rollups.STAT_FIELDS, "")})
+        customer_id = str(customers[0]["_id"])
+        async with api(db) as http:
+            # An incremental write on an old rollup must not start its extra/less fields from zero
+            (await http.post("/variations", json={"customer_id": customer_id, "date": "2025-01-05T00:00:00", "morning_quantity": 9.0, "evening_quantity": 0.0})).raise_for_status()
+        rollup = await db[rollups.ROLLUPS_COLLECTION].find_one({"_id": rollups.rollup_id(customer_id, 2025, 1)})
+        assert all(rollup[field] is None for field in rollups.STAT_FIELDS)
+        assert await rollups.backfill_stats(db) > 0
+        assert await rollups.check_rollups(db) == []
+        assert await rollups.backfill_stats(db) == 0
+        top = await analytics.top_customers(db, 1, 2025, "extra_liters", 10)
+        assert {r["customer_id"] for r in top} >= {r["customer_id"] for r in expected if r["customer_id"] != customer_id}
+    run_db(test)
+
+def test_stat_row_counts_unbackfilled_fields_as_zero():
+    rollup = {"customer_id": "0" * 24, "customer_name": "Ram", "total_morning": 30.0, "total_evening": 15.0, "skip_count": 2,
+              "extra_count": None, "extra_liters": None, "less_count": None}
+    row = analytics.stat_row(rollup)
+    assert (row["extra_days"], row["extra_liters"], row["less_days"], row["less_liters"]) == (0, 0, 0, 0)
@@ -0,0 +1,34 @@
+import subprocess
+import sys
+from datetime import datetime
+import pytest
+from pydantic import ValidationError
+from benchmarks import datagen
+import main
+import statements
+
+START = datetime(2025, 1, 1)
+
+def test_importing_the_app_does_not_load_numpy():
+    code = "import sys, main; sys.exit('numpy' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
+
+def test_statement_request_caps_customers():
+    ids = [f"{i:024x}" for i in range(statements.MAX_STATEMENT_CUSTOMERS + 1)]
+    with pytest.raises(ValidationError):
+        main.StatementRequest(customer_ids=ids, start="2025-01-01", end="2025-01-31")
+
+def test_statements_match_each_customer_bill(run_db, api):
+    async def test(db):
+        customers, _ = await datagen.load(db, 25, 60, START, seed=7)
+        async with api(db) as http:
+            customer_id = str(customers[0]["_id"])
+            (await http.post("/variations", json={"customer_id": customer_id, "date": "2025-01-05T00:00:00", "morning_quantity": 3.3, "evening_quantity": 0.1})).raise_for_status()
+            body = {"customer_ids": [str(c["_id"]) for c in customers], "start": "2025-01-01", "end": "2025-03-31"}
+            response = (await http.post("/statements", json=body)).json()
+            assert len(response["statements"]) == len(customers)
+            for statement in response["statements"]:
+                for month in statement["months"]:
+                    bill = (await http.get(f"/customers/{statement['customer_id']}/bill", params={"month": month["month"], "year": month["year"]})).json()
+                    assert (month["total_liters"], month["amount_due"]) == (bill["total_liters"], bill["amount_due"])
+    run_db(test)
@@ -0,0 +1,19 @@
+from write_queue import WriteQueue
+
+CUSTOMERS = [{"_id": "b" * 24, "name": "Sita Verma", "default_milk_morning": 1.0, "default_milk_evening": 0.5},
+             {"_id": "a" * 24, "name": "राम शर्मा", "default_milk_morning": 2.0, "default_milk_evening": 0.0}]
+
+def test_known_customers_survive_a_new_queue(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    WriteQueue(path, session=None, api_url="http://unused").save_customers(CUSTOMERS)
+    # A restarted app with the API down still has the list
+    queue = WriteQueue(path, session=None, api_url="http://unused")
+    assert queue.known_customers() == CUSTOMERS
+    assert queue.known_customer("a" * 24)["name"] == "राम शर्मा"
+    assert queue.known_customer("c" * 24) is None
+
+def test_save_customers_replaces_the_list(tmp_path):
+    queue = WriteQueue(str(tmp_path / "queue.sqlite3"), session=None, api_url="http://unused")
+    queue.save_customers(CUSTOMERS)
+    queue.save_customers(CUSTOMERS[:1])
+    assert queue.known_customers() == CUSTOMERS[:1]
@@ -0,0 +1,176 @@
+"""Durable write-behind queue for the Streamlit client.
+
+Writes are stored in a local SQLite file and return immediately. A background
+thread sends them to the API in batches, retrying with exponential backoff
+while the API is asleep or unreachable. Variations are keyed by
+(customer_id, date), so logging the same day twice before a flush keeps only
+the last value. Writes the API rejects outright (4xx) are kept as failed
+rather than retried forever.
+
+The same file keeps the last customer list the app fetched, so customer names
+can still be resolved, and writes queued, while the API is unreachable.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+BATCH_SIZE = 200
+MAX_BACKOFF_SECONDS = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+)
+"""
+
+KNOWN_CUSTOMERS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS known_customers (
+    id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL
+)
+"""
+
+class WriteQueue:
+    def __init__(self, path: str, session, api_url: str, poll_seconds: float = 2.0):
+        self.path = path
+        self.session = session
+        self.api_url = api_url
+        self.poll_seconds = poll_seconds
+        self.wake = threading.Event()
+        # Bumped after every successful flush so readers know their cached GETs are stale
+        self.generation = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            conn.execute(KNOWN_CUSTOMERS_SCHEMA)
+        self.thread = threading.Thread(target=self._run, name="write-queue-flusher", daemon=True)
+        self.thread.start()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _put(self, key: str, kind: str, payload):
+        # revision lets the flusher tell whether a row was overwritten while its batch was in flight
+        with self._connect() as conn:
+            conn.execute("INSERT INTO pending (key, kind, payload, revision) VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT(key) DO UPDATE SET payload = excluded.payload, revision = pending.revision + 1, attempts = 0, next_attempt = 0, failed = 0, last_error = NULL",
+                         (key, kind, json.dumps(payload), 0))
+        self.wake.set()
+
+    def enqueue_variation(self, variation):
+        self._put(f"variation:{variation['customer_id']}:{variation['date']}", "variation", variation)
+
+    def enqueue_customer(self, customer):
+        self._put(f"customer:{uuid.uuid4()}", "customer", customer)
+
+    def save_customers(self, customers):
+        """Replaces the last-known customer list with this one."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM known_customers")
+            conn.executemany("INSERT INTO known_customers (id, payload) VALUES (?, ?)", [(c["_id"], json.dumps(c)) for c in customers])
+
+    def known_customers(self):
+        """The last customer list passed to save_customers, in the same order."""
+        with self._connect() as conn:
+            return [json.loads(payload) for (payload,) in conn.execute("SELECT payload FROM known_customers ORDER BY rowid")]
+
+    def known_customer(self, customer_id: str):
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload FROM known_customers WHERE id = ?", (customer_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def counts(self):
+        """(pending, failed) row counts."""
+        with self._connect() as conn:
+            pending, failed = conn.execute("SELECT COUNT(*) - COALESCE(SUM(failed), 0), COALESCE(SUM(failed), 0) FROM pending").fetchone()
+        return pending, failed
+
+    def failures(self):
+        with self._connect() as conn:
+            return [{"kind": kind, "payload": json.loads(payload), "error": error} for kind, payload, error in
+                    conn.execute("SELECT kind, payload, last_error FROM pending WHERE failed = 1 ORDER BY key")]
+
+    def discard_failed(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM pending WHERE failed = 1")
+
+    def flush_now(self):
+        """Makes every pending row due immediately and wakes the flusher."""
+        with self._connect() as conn:
+            conn.execute("UPDATE pending SET next_attempt = 0 WHERE failed = 0")
+        self.wake.set()
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.poll_seconds)
+            self.wake.clear()
+            try:
+                while self._flush_once():
+                    pass
+            except Exception:
+                # Never let the flusher die; the rows stay queued for the next pass
+                time.sleep(self.poll_seconds)
+
+    def _due(self, kind: str):
+        with self._connect() as conn:
+            return conn.execute("SELECT key, payload, revision, attempts FROM pending WHERE kind = ? AND failed = 0 AND next_attempt <= ? ORDER BY rowid LIMIT ?",
+                                (kind, time.time(), BATCH_SIZE)).fetchall()
+
+    def _settle(self, done, retry, failed):
+        """done: [(key, revision)], retry: [(key, revision, attempts, error)], failed: [(key, revision, error)]."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM pending WHERE key = ? AND revision = ?", done)
+            conn.executemany("UPDATE pending SET attempts = ?, next_attempt = ?, last_error = ? WHERE key = ? AND revision = ?",
+                             [(attempts + 1, now + min(MAX_BACKOFF_SECONDS, 2 ** attempts), error, key, revision) for key, revision, attempts, error in retry])
+            conn.executemany("UPDATE pending SET failed = 1, last_error = ? WHERE key = ? AND revision = ?", [(error, key, revision) for key, revision, error in failed])
+        if done:
+            self.generation += 1
+
+    def _flush_once(self):
+        """Sends one batch of each kind; returns True if anything was sent."""
+        sent = False
+        rows = self._due("variation")
+        if rows:
+            sent = True
+            done, retry, failed = [], [], []
+            try:
+                response = self.session.post(f"{self.api_url}/variations/bulk", json={"variations": [json.loads(r[1]) for r in rows]}, timeout=30)
+            except Exception as e:
+                retry = [(key, revision, attempts, str(e)) for key, _, revision, attempts in rows]
+            else:
+                if response.status_code == 201:
+                    for (key, _, revision, attempts), item in zip(rows, response.json()["results"]):
+                        if item["ok"]:
+                            done.append((key, revision))
+                        else:
+                            failed.append((key, revision, item.get("error", "rejected")))
+                elif 400 <= response.status_code < 500:
+                    failed = [(key, revision, response.text) for key, _, revision, _ in rows]
+                else:
+                    retry = [(key, revision, attempts, f"HTTP {response.status_code}") for key, _, revision, attempts in rows]
+            self._settle(done, retry, failed)
+
+        for key, payload, revision, attempts in self._due("customer"):
+            sent = True
+            try:
+                response = self.session.post(f"{self.api_url}/customers", json=json.loads(payload), timeout=30)
+            except Exception as e:
+                self._settle([], [(key, revision, attempts, str(e))], [])
+                continue
+            if response.status_code == 201:
+                self._settle([(key, revision)], [], [])
+            elif 400 <= response.status_code < 500:
+                self._settle([], [], [(key, revision, response.text)])
+            else:
+                self._settle([], [(key, revision, attempts, f"HTTP {response.status_code}")], [])
+        return sent